@@ -0,0 +1,449 @@
+"""Автозбереження журналом операцій.
+
+Кожна правка з журналу скасування дописується в кінець файлу компактним записом
+(ідентифікатори фігур і лише змінені поля). Записи накопичуються в пам'яті і
+скидаються на диск пачками з одним fsync; коли журнал розростається, він
+стискається в повний знімок сцени. Після збою сцену відновлює повторне
+виконання журналу поверх цього знімка.
+
+Файл: заголовок (сигнатура, версія, шлях документа), далі записи
+[код операції, довжина, crc32] + дані. Обірваний чи пошкоджений хвіст
+(збій посеред запису) просто відкидається."""
+import gc
+import os
+import struct
+import zlib
+import numpy as np
+from PyQt5.QtCore import QObject, QTimer, QStandardPaths
+from styles import styles
+from store import default_store, KIND_CODES, ALIVE, FILL
+from shapes import SHAPE_CLASSES
+from history import AddShapes, DeleteShapes, MoveShapes, ChangeGeometry, ChangeStyle, EditText
+from files import replace_file
+
+JOURNAL_MAGIC = b'RGRJ'
+JOURNAL_VERSION = 1
+JOURNAL_HEADER = struct.Struct('<4sHH') # сигнатура, версія, довжина шляху документа
+RECORD = struct.Struct('<BxxxII')       # операція, довжина даних, crc32 даних
+
+# Операції
+OP_STYLE = 1  # визначення стилю: id журналу -> ключ стилю
+OP_ADD = 2    # фігури повністю (id, z, тип, стиль, координати, текст)
+OP_DELETE = 3
+OP_MOVE = 4   # зсув набору фігур
+OP_COORDS = 5 # нові координати набору фігур
+OP_RESTYLE = 6
+OP_TEXT = 7
+OP_SAVED = 8  # документ збережено - все до цього місця вже у файлі
+
+COUNT = struct.Struct('<I')
+MOVE = struct.Struct('<iiI')
+ID = struct.Struct('<q')
+STYLE_DEF = struct.Struct('<IIIHHhB') # id, колір, заливка, товщина, тип лінії, розмір шрифту, чи є шрифт
+ADD_RECORD = np.dtype([('id', '<i8'), ('z', '<f8'), ('kind', 'u1'), ('fill', 'u1'), ('pad', '<u2'),
+                       ('style', '<u4'), ('coords', '<i4', (10,)), ('text_len', '<u4')])
+ADD_ONE = struct.Struct('<qdBBxxI10iI') # той самий запис - для швидкого розбору однієї фігури
+TEXT = KIND_CODES['text']
+
+FLUSH_INTERVAL = 2000        # мс між пачками fsync
+FLUSH_BYTES = 1 << 20        # або раніше, якщо стільки накопичилось
+COMPACT_MIN_BYTES = 4 << 20  # стискати, коли журнал більший за це
+COMPACT_RATIO = 2            # ... і вдвічі більший за останній знімок
+
+def data_dir():
+    path = QStandardPaths.writableLocation(QStandardPaths.AppDataLocation)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+def journal_path(document):
+    # Журнал лежить поруч з документом; для нового документа чи теки без права запису - у даних програми
+    if document:
+        folder, name = os.path.split(os.path.abspath(document))
+        if os.access(folder, os.W_OK):
+            return os.path.join(folder, f".{name}.journal")
+    return os.path.join(data_dir(), "untitled.journal")
+
+def session_file():
+    # Вказівник на журнал поточного сеансу - за ним журнал знаходимо при запуску
+    return os.path.join(data_dir(), "session")
+
+class Journal:
+    """Файл журналу: буфер записів, пакетний fsync і стиснення в знімок"""
+
+    def __init__(self, path, document=None):
+        self.path = path
+        self.document = document
+        self.buffer = bytearray()
+        self.file = None
+        self.size = 0          # байтів на диску
+        self.snapshot_size = 0 # розмір останнього знімка
+        self.serial = 0        # кількість записаних операцій (не скидається при стисненні)
+        self.clean = False     # остання операція - збереження документа
+        self.styles = set()    # стилі, вже визначені в цьому файлі
+
+    def header(self):
+        name = (self.document or '').encode('utf-8')
+        return JOURNAL_HEADER.pack(JOURNAL_MAGIC, JOURNAL_VERSION, len(name)) + name
+
+    def append(self, op, payload=b''):
+        self.buffer += RECORD.pack(op, len(payload), zlib.crc32(payload))
+        self.buffer += payload
+        self.serial += 1
+        self.clean = op == OP_SAVED
+
+    def flush(self):
+        # Одна пачка - один write і один fsync
+        if not self.buffer or self.file is None: return
+        self.file.write(self.buffer)
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.size += len(self.buffer)
+        self.buffer.clear()
+
+    def pending_bytes(self):
+        return len(self.buffer)
+
+    def should_compact(self):
+        return self.size > COMPACT_MIN_BYTES and self.size > COMPACT_RATIO * self.snapshot_size
+
+    def rewrite(self, store, rows, ids, zs, texts, clean):
+        # Стиснення: новий файл - знімок сцени (атомарна заміна старого)
+        if self.file: self.file.close()
+        serial = self.serial
+        self.buffer.clear()
+        self.styles.clear()
+        self.add(store, rows, ids, zs, texts)
+        if clean: self.append(OP_SAVED)
+        self.serial, self.clean = serial, clean
+        with replace_file(self.path, 'wb') as f:
+            f.write(self.header())
+            f.write(self.buffer)
+        self.size = self.snapshot_size = len(self.header()) + len(self.buffer)
+        self.buffer.clear()
+        self.file = open(self.path, 'ab')
+
+    def close(self, remove=False):
+        if self.file:
+            self.flush()
+            self.file.close()
+            self.file = None
+        if remove and os.path.exists(self.path): os.remove(self.path)
+
+    # --- Кодування операцій ---
+    def define_styles(self, style_ids):
+        for style_id in set(np.asarray(style_ids).tolist()):
+            if style_id in self.styles: continue
+            self.styles.add(style_id)
+            color, fill, width, line_style, family, size = styles.by_id[style_id].key
+            name = (family or '').encode('utf-8')
+            self.append(OP_STYLE, STYLE_DEF.pack(style_id, color, fill, width, line_style,
+                                                 -1 if size is None else size, family is not None) + name)
+
+    def add(self, store, rows, ids, zs, texts):
+        # texts: номер у rows -> текст (лише для текстових фігур)
+        rows = np.asarray(rows, np.intp)
+        if not len(rows): return
+        self.define_styles(store.style[rows])
+        if len(rows) == 1:
+            # Одна фігура (найчастіше - щойно намальована) - без проміжного масиву
+            row = rows[0]
+            text = texts[0].encode('utf-8') if texts else b''
+            self.append(OP_ADD, COUNT.pack(1) + ADD_ONE.pack(int(np.asarray(ids)[0]), float(np.asarray(zs)[0]),
+                                                             store.kind[row], store.flags[row] & FILL, store.style[row],
+                                                             *store.coords[row].tolist(), len(text)) + text)
+            return
+        rec = np.zeros(len(rows), ADD_RECORD)
+        rec['id'] = ids
+        rec['z'] = zs
+        rec['kind'] = store.kind[rows]
+        rec['fill'] = store.flags[rows] & FILL
+        rec['style'] = store.style[rows]
+        rec['coords'] = store.coords[rows]
+        heap = []
+        if texts:
+            order = sorted(texts)
+            heap = [texts[i].encode('utf-8') for i in order]
+            rec['text_len'][order] = [len(b) for b in heap]
+        self.append(OP_ADD, COUNT.pack(len(rows)) + rec.tobytes() + b''.join(heap))
+
+    def delete(self, ids):
+        ids = np.asarray(ids, '<i8')
+        self.append(OP_DELETE, COUNT.pack(len(ids)) + ids.tobytes())
+
+    def move(self, ids, dx, dy):
+        ids = np.asarray(ids, '<i8')
+        self.append(OP_MOVE, MOVE.pack(dx, dy, len(ids)) + ids.tobytes())
+
+    def set_coords(self, ids, coords):
+        ids = np.asarray(ids, '<i8')
+        self.append(OP_COORDS, COUNT.pack(len(ids)) + ids.tobytes() + np.asarray(coords, '<i4').tobytes())
+
+    def set_style(self, ids, style_ids, fill):
+        ids = np.asarray(ids, '<i8')
+        self.define_styles(style_ids)
+        self.append(OP_RESTYLE, COUNT.pack(len(ids)) + ids.tobytes() +
+                    np.asarray(style_ids, '<u4').tobytes() + (np.asarray(fill) & FILL).astype('u1').tobytes())
+
+    def set_text(self, id_, text):
+        self.append(OP_TEXT, ID.pack(id_) + text.encode('utf-8'))
+
+    def saved(self):
+        self.append(OP_SAVED)
+
+class Recovered:
+    """Результат відтворення журналу"""
+
+    def __init__(self, shapes, document, clean, operations):
+        self.shapes = shapes         # фігури в порядку z
+        self.document = document     # шлях документа або None
+        self.clean = clean           # після останнього збереження змін не було
+        self.operations = operations # скільки записів виконано
+
+def replay(path):
+    # Збирач циклів на мільйонах дрібних списків стану лише марнує час - вимикаємо на час відтворення
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        return replay_journal(path)
+    finally:
+        if enabled: gc.enable()
+
+def grow(array, index):
+    result = np.zeros(max(2 * len(array), index + 1), array.dtype)
+    result[:len(array)] = array
+    return result
+
+def replay_journal(path):
+    # Стан кожної фігури - короткий список Python (дешевше за NumPy на одиничних правках),
+    # у спільне сховище все переноситься цілими колонками наприкінці
+    with open(path, 'rb') as f:
+        data = f.read()
+    if len(data) < JOURNAL_HEADER.size: raise ValueError("Журнал пошкоджено")
+    magic, version, name_len = JOURNAL_HEADER.unpack_from(data, 0)
+    if magic != JOURNAL_MAGIC or version != JOURNAL_VERSION: raise ValueError("Невідомий формат журналу")
+    mv = memoryview(data)
+    pos = JOURNAL_HEADER.size + name_len
+    document = bytes(mv[JOURNAL_HEADER.size:pos]).decode('utf-8') or None
+
+    state = {} # id -> [тип, стиль, заливка, z, координати (10), текст]
+    # Накопичені зсуви - масиви за id фігури (id сцени зростають і не повторюються)
+    shift_x = np.zeros(1024, np.int64)
+    shift_y = np.zeros(1024, np.int64)
+    lut = {}   # id стилю в журналі -> id у таблиці стилів
+    clean = False
+    count = 0
+    end_of_data = len(data)
+    unpack_record, crc32 = RECORD.unpack_from, zlib.crc32
+    unpack_move, unpack_id, unpack_count, unpack_one = MOVE.unpack_from, ID.unpack_from, COUNT.unpack_from, ADD_ONE.unpack_from
+    while pos + RECORD.size <= end_of_data:
+        op, length, crc = unpack_record(data, pos)
+        start = pos + RECORD.size
+        end = start + length
+        if end > end_of_data: break # обірваний запис
+        payload = mv[start:end]
+        if crc32(payload) != crc: break
+        pos = end
+        count += 1
+        clean = op == OP_SAVED
+
+        if op == OP_MOVE:
+            # Зсуви лише накопичуємо - до координат їх додамо одним масивом наприкінці
+            dx, dy, n = unpack_move(payload)
+            ids = unpack_id(payload, MOVE.size)[0] if n == 1 else np.frombuffer(payload, '<i8', n, MOVE.size)
+            shift_x[ids] += dx
+            shift_y[ids] += dy
+        elif op == OP_COORDS:
+            n = unpack_count(payload)[0]
+            ids = struct.unpack_from(f'<{n}q', payload, COUNT.size)
+            values = struct.unpack_from(f'<{n * 10}i', payload, COUNT.size + 8 * n)
+            for k, i in enumerate(ids):
+                state[i][4] = values[k * 10:k * 10 + 10]
+                shift_x[i] = shift_y[i] = 0
+        elif op == OP_ADD:
+            n = unpack_count(payload)[0]
+            if n == 1:
+                i, z, kind, fill, style, *coords, text_len = unpack_one(payload, COUNT.size)
+                text = bytes(payload[COUNT.size + ADD_ONE.size:]).decode('utf-8') if kind == TEXT else None
+                state[i] = [kind, lut[style], fill, z, coords, text]
+                if i >= len(shift_x): shift_x, shift_y = grow(shift_x, i), grow(shift_y, i)
+                shift_x[i] = shift_y[i] = 0
+                continue
+            rec = np.frombuffer(payload, ADD_RECORD, n, COUNT.size)
+            top = int(rec['id'].max())
+            if top >= len(shift_x): shift_x, shift_y = grow(shift_x, top), grow(shift_y, top)
+            shift_x[rec['id']] = shift_y[rec['id']] = 0
+            lengths = rec['text_len'].tolist()
+            ends = (COUNT.size + n * ADD_RECORD.itemsize + np.cumsum(rec['text_len'], dtype=np.int64)).tolist()
+            for i, z, kind, fill, style, coords, text_len, text_end in zip(
+                    rec['id'].tolist(), rec['z'].tolist(), rec['kind'].tolist(), rec['fill'].tolist(),
+                    rec['style'].tolist(), rec['coords'].tolist(), lengths, ends):
+                text = bytes(payload[text_end - text_len:text_end]).decode('utf-8') if kind == TEXT else None
+                state[i] = [kind, lut[style], fill, z, coords, text]
+        elif op == OP_DELETE:
+            n = unpack_count(payload)[0]
+            for i in struct.unpack_from(f'<{n}q', payload, COUNT.size):
+                del state[i]
+        elif op == OP_RESTYLE:
+            n = unpack_count(payload)[0]
+            ids = struct.unpack_from(f'<{n}q', payload, COUNT.size)
+            style_ids = struct.unpack_from(f'<{n}I', payload, COUNT.size + 8 * n)
+            fills = payload[COUNT.size + 12 * n:COUNT.size + 13 * n]
+            for i, style, fill in zip(ids, style_ids, fills):
+                st = state[i]
+                st[1], st[2] = lut[style], fill
+        elif op == OP_TEXT:
+            state[unpack_id(payload)[0]][5] = bytes(payload[ID.size:]).decode('utf-8')
+        elif op == OP_STYLE:
+            journal_id, color, fill, width, line_style, size, has_family = STYLE_DEF.unpack_from(payload)
+            family = bytes(payload[STYLE_DEF.size:]).decode('utf-8') if has_family else None
+            lut[journal_id] = styles.intern_key((color, fill, width, line_style, family,
+                                                 None if size < 0 else size)).id
+        elif op != OP_SAVED:
+            break # невідома операція - далі не довіряємо
+
+    # Живі фігури в порядку z переносимо в спільне сховище цілими колонками
+    order = sorted(state, key=lambda i: state[i][3])
+    live = [state[i] for i in order]
+    n = len(live)
+    store = default_store
+    kinds = np.fromiter((st[0] for st in live), np.int8, n)
+    rows = store.allocate_many(kinds)
+    if n:
+        coords = np.array([st[4] for st in live], np.int32)
+        ids = np.array(order, np.int64)
+        coords[:, 0::2] += shift_x[ids, None].astype(np.int32)
+        coords[:, 1::2] += shift_y[ids, None].astype(np.int32)
+        store.coords[rows] = coords
+    store.style[rows] = np.fromiter((st[1] for st in live), np.int32, n)
+    store.flags[rows] = ALIVE | (np.fromiter((st[2] for st in live), np.uint8, n) & FILL)
+    shapes = [SHAPE_CLASSES[st[0]].view(store, row, st[5]) if st[0] == TEXT else SHAPE_CLASSES[st[0]].view(store, row)
+              for row, st in zip(rows.tolist(), live)]
+    return Recovered(shapes, document, clean, count)
+
+class Autosave(QObject):
+    """Автозбереження сцени полотна: слухає журнал скасування і пише операції в Journal"""
+
+    def __init__(self, canvas, parent=None):
+        super().__init__(parent)
+        self.canvas = canvas
+        self.journal = None
+        self.stale = False # сцену замінено цілком - наступне скидання пише знімок
+        self.timer = QTimer(self)
+        self.timer.setInterval(FLUSH_INTERVAL)
+        self.timer.timeout.connect(self.flush)
+        canvas.history.journal = self
+
+    @staticmethod
+    def pending():
+        # Журнал попереднього сеансу, що завершився без закриття вікна; None - відновлювати нічого
+        try:
+            with open(session_file(), encoding='utf-8') as f:
+                path = f.read().strip()
+        except OSError:
+            return None
+        return path if path and os.path.exists(path) else None
+
+    @staticmethod
+    def discard(path):
+        if path and os.path.exists(path): os.remove(path)
+
+    @staticmethod
+    def set_aside(path):
+        # Журнал, який не вдалося прочитати, не видаляємо і не пробуємо знову при кожному запуску:
+        # перейменовуємо поруч, щоб його можна було дослідити чи відновити вручну
+        bad = path + ".bad"
+        try:
+            os.replace(path, bad)
+        except OSError:
+            return None
+        return bad
+
+    def start(self, document=None, clean=True):
+        # Новий журнал для документа, що починається зі знімка поточної сцени
+        path = journal_path(document)
+        if self.journal: self.journal.close(remove=self.journal.path != path)
+        self.journal = Journal(path, document)
+        self.compact(clean)
+        with replace_file(session_file(), 'w', encoding='utf-8') as f:
+            f.write(path)
+        self.timer.start()
+
+    def compact(self, clean=None):
+        # Знімок сцени замість накопичених операцій; позначка збереження зберігається
+        c = self.canvas
+        shapes, ids, zs = c.scene_record(c.get_shapes())
+        rows = c.rows_of(shapes)
+        self.journal.rewrite(c.store, rows, ids, zs, self.texts_of(shapes, rows),
+                             self.journal.clean if clean is None else clean)
+        self.stale = False
+
+    def flush(self):
+        if self.journal is None: return
+        if self.stale:
+            self.compact(False)
+            return
+        self.journal.flush()
+        if self.journal.should_compact(): self.compact()
+
+    def save_token(self):
+        # Позиція в журналі на момент знімка для збереження
+        return self.journal.serial if self.journal else None
+
+    def mark_saved(self, document, token):
+        # Збереження завершено; чисто, якщо після знімка не було правок
+        if self.journal is None: return
+        clean = token == self.journal.serial
+        if journal_path(document) != self.journal.path or document != self.journal.document:
+            self.start(document, clean)
+        elif clean:
+            self.journal.saved()
+            self.flush()
+
+    def close(self):
+        # Завершення сеансу. Журнал видаляємо, лише якщо остання операція в ньому -
+        # вдале збереження; інакше незбережені зміни залишаються для відновлення
+        self.timer.stop()
+        if self.journal:
+            self.flush()
+            clean = self.journal.clean
+            self.journal.close(remove=clean)
+            self.journal = None
+            if not clean: return
+        self.discard(session_file())
+
+    # --- Події журналу скасування ---
+    def reset(self):
+        self.stale = True
+
+    def record(self, command, undo=False):
+        journal = self.journal
+        if journal is None or self.stale: return
+        c = self.canvas
+        kind = type(command)
+        if kind is AddShapes or kind is DeleteShapes:
+            if (kind is AddShapes) != undo:
+                rows = c.rows_of(command.shapes)
+                journal.add(c.store, rows, command.ids, command.zs, self.texts_of(command.shapes, rows))
+            else:
+                journal.delete(command.ids)
+        elif kind is MoveShapes:
+            sign = -1 if undo else 1
+            journal.move(self.ids_of(command.shapes), sign * command.dx, sign * command.dy)
+        elif kind is ChangeGeometry:
+            journal.set_coords(self.ids_of(command.shapes), command.old if undo else command.new)
+        elif kind is ChangeStyle:
+            style_ids, fill = command.old if undo else command.new
+            journal.set_style(self.ids_of(command.shapes), style_ids, fill)
+        elif kind is EditText:
+            journal.set_text(c.scene.id_of(command.shape), command.old if undo else command.new)
+        if journal.pending_bytes() > FLUSH_BYTES: self.flush()
+
+    def record_undo(self, command):
+        self.record(command, True)
+
+    def texts_of(self, shapes, rows):
+        return {i: shapes[i].text for i in np.flatnonzero(self.canvas.store.kind[rows] == TEXT).tolist()}
+
+    def ids_of(self, shapes):
+        scene = self.canvas.scene
+        return [scene.id_of(s) for s in shapes]
@@ -0,0 +1,59 @@
+"""Час кадру для сцени з прямокутників: малювання по одній фігурі
+проти груп однакового стилю. Запуск: python benchmarks/bench_batching.py [кількість]"""
+import os
+import sys
+import time
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PyQt5.QtWidgets import QApplication
+from PyQt5.QtCore import Qt, QPoint
+from PyQt5.QtGui import QPainter, QImage, QColor
+from shapes import Rectangle
+from renderer import Renderer
+
+def make_scene(n, run_length=50):
+    # Типовий технічний рисунок: фігури додаються серіями одного стилю
+    colors = [QColor(0, 0, 0), QColor(200, 0, 0), QColor(0, 120, 0), QColor(0, 0, 200)]
+    result = []
+    for i in range(n):
+        x, y = (i * 37) % 1950, (i * 53) % 1950
+        s = Rectangle(QPoint(x, y), QPoint(x + 40, y + 30))
+        s.set_color(colors[(i // run_length) % len(colors)])
+        if (i // run_length) % 3 == 0: s.set_fill_color(QColor(255, 255, 200))
+        result.append(s)
+    return result
+
+def frame(scene, batched, repeats=5):
+    image = QImage(2000, 2000, QImage.Format_ARGB32_Premultiplied)
+    best = None
+    renderer = Renderer()
+    for _ in range(repeats):
+        image.fill(Qt.white)
+        painter = QPainter(image)
+        t = time.perf_counter()
+        if batched:
+            renderer.reset_stats()
+            renderer.draw(painter, scene)
+        else:
+            for s in scene: s.draw(painter)
+        elapsed = time.perf_counter() - t
+        painter.end()
+        best = elapsed if best is None else min(best, elapsed)
+    return best, image, renderer.stats
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    app = QApplication(sys.argv)
+    scene = make_scene(n)
+    single, img1, _ = frame(scene, False)
+    batched, img2, stats = frame(scene, True)
+    print(f"Прямокутників: {n}")
+    print(f"по одній:  {single * 1000:8.1f} мс")
+    print(f"групами:   {batched * 1000:8.1f} мс ({stats['batches']} груп), "
+          f"прискорення x{single / batched:.2f}")
+    print("Зображення однакові" if img1 == img2 else "УВАГА: зображення відрізняються")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""Розмір файлу і час відкриття документа: JSON проти двійкового .vgb.
+Запуск: python benchmarks/bench_files.py [кількість]"""
+import os
+import sys
+import tempfile
+import time
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PyQt5.QtWidgets import QApplication
+from PyQt5.QtCore import QPoint
+from PyQt5.QtGui import QColor
+from shapes import Rectangle, Ellipse, Line, Triangle, Arrow, TextShape
+from files import FileManager
+
+KINDS = [Rectangle, Ellipse, Line, Triangle, Arrow, TextShape]
+COLORS = [QColor(0, 0, 0), QColor(200, 30, 30), QColor(30, 120, 200), QColor(20, 160, 60)]
+
+def make_document(n):
+    result = []
+    for i in range(n):
+        x, y = (i * 37) % 5000, (i * 91) % 5000
+        s = KINDS[i % len(KINDS)](QPoint(x, y), QPoint(x + 20 + i % 50, y + 15 + i % 40))
+        s.set_color(COLORS[i % len(COLORS)])
+        s.set_line_width(1 + i % 3)
+        if isinstance(s, TextShape): s.text = f"Підпис {i}"
+        result.append(s)
+    return result
+
+def best_load(filename, repeats=3):
+    best = None
+    for _ in range(repeats):
+        t = time.perf_counter()
+        shapes = FileManager.read(filename)
+        elapsed = time.perf_counter() - t
+        best = elapsed if best is None else min(best, elapsed)
+    return best, shapes
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    app = QApplication(sys.argv)
+    document = make_document(n)
+    expected = [s.to_dict() for s in document]
+    print(f"Фігур: {n}")
+    with tempfile.TemporaryDirectory() as tmp:
+        results = {}
+        for ext in ('json', 'vgb'):
+            path = os.path.join(tmp, f"doc.{ext}")
+            t = time.perf_counter()
+            FileManager.write(document, path)
+            save = time.perf_counter() - t
+            load, shapes = best_load(path)
+            same = [s.to_dict() for s in shapes] == expected
+            del shapes
+            results[ext] = (os.path.getsize(path), save, load)
+            print(f"{ext:5}: {results[ext][0] / 1e6:7.2f} МБ, запис {save * 1000:7.0f} мс, "
+                  f"відкриття {load * 1000:7.0f} мс{'' if same else '  УВАГА: фігури відрізняються'}")
+        (js, _, jl), (vs, _, vl) = results['json'], results['vgb']
+        print(f"vgb менший у {js / vs:.1f} раза, відкривається у {jl / vl:.1f} раза швидше")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""Журнал автозбереження: запис і відтворення мільйона операцій редагування.
+Модель сцени ведеться паралельно, і результат відтворення звіряється з нею.
+Запуск: python benchmarks/bench_journal.py [операцій]"""
+import os
+import random
+import sys
+import tempfile
+import time
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from PyQt5.QtCore import Qt
+from PyQt5.QtGui import QColor
+from styles import styles
+from store import ShapeStore, KIND_CODES, ALIVE, FILL
+from autosave import Journal, replay
+
+TEXT = KIND_CODES['text']
+
+def make_styles():
+    result = []
+    for i in range(8):
+        s = styles.intern(QColor(30 * i, 0, 255 - 30 * i), QColor(255, 255, 255, 0), 1 + i % 3, Qt.SolidLine)
+        result.append(s.id)
+    result.append(styles.intern(QColor(0, 0, 0), QColor(255, 255, 0), 2, Qt.SolidLine, "Arial", 20).id)
+    return result
+
+def main():
+    total = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    rnd = random.Random(1)
+    style_ids = make_styles()
+    model = ShapeStore()
+    rows = {}  # id -> рядок моделі
+    zs = {}
+    texts = {}
+    alive = [] # id живих фігур (для випадкового вибору)
+    next_id = 1
+
+    path = os.path.join(tempfile.mkdtemp(), "bench.journal")
+    journal = Journal(path, "bench.json")
+    journal.rewrite(model, [], [], [], {}, False)
+
+    t0 = time.perf_counter()
+    for n in range(total):
+        r = rnd.random()
+        if r < 0.3 or len(alive) < 100:
+            kind = rnd.randint(1, 6)
+            row = model.allocate(kind)
+            x, y = rnd.randrange(5000), rnd.randrange(5000)
+            model.coords[row, :4] = (x, y, x + rnd.randrange(10, 200), y + rnd.randrange(10, 200))
+            model.style[row] = style_ids[-1] if kind == TEXT else rnd.choice(style_ids[:-1])
+            id_ = next_id
+            next_id += 1
+            rows[id_], zs[id_] = row, float(id_)
+            alive.append(id_)
+            text = {}
+            if kind == TEXT:
+                texts[id_] = text[0] = f"Підпис {id_}"
+            journal.add(model, [row], [id_], [zs[id_]], text)
+        elif r < 0.7:
+            ids = [rnd.choice(alive)] if r < 0.65 else rnd.sample(alive, 50)
+            dx, dy = rnd.randint(-20, 20), rnd.randint(-20, 20)
+            model.move([rows[i] for i in ids], dx, dy)
+            journal.move(ids, dx, dy)
+        elif r < 0.8:
+            id_ = rnd.choice(alive)
+            model.coords[rows[id_], 2:4] += rnd.randint(-5, 5)
+            journal.set_coords([id_], model.coords[[rows[id_]]])
+        elif r < 0.88:
+            id_ = rnd.choice(alive)
+            row = rows[id_]
+            if model.kind[row] != TEXT:
+                model.style[row] = rnd.choice(style_ids[:-1])
+                model.flags[row] = ALIVE | (FILL if rnd.random() < 0.5 else 0)
+            journal.set_style([id_], model.style[[row]], model.flags[[row]])
+        elif r < 0.9:
+            id_ = rnd.choice(alive)
+            if model.kind[rows[id_]] == TEXT:
+                texts[id_] = f"Змінено {n}"
+                journal.set_text(id_, texts[id_])
+        else:
+            i = rnd.randrange(len(alive))
+            alive[i], alive[-1] = alive[-1], alive[i]
+            id_ = alive.pop()
+            model.release(rows.pop(id_))
+            del zs[id_]
+            texts.pop(id_, None)
+            journal.delete([id_])
+        if n % 4096 == 0: journal.flush() # пакетний fsync
+    journal.close()
+    write = time.perf_counter() - t0
+    size = os.path.getsize(path)
+
+    t0 = time.perf_counter()
+    result = replay(path)
+    elapsed = time.perf_counter() - t0
+
+    # Звіряємо з моделлю в порядку z
+    order = sorted(rows, key=zs.get)
+    expected = [rows[i] for i in order]
+    got = [s.row for s in result.shapes]
+    store = result.shapes[0].store if result.shapes else model
+    same = (len(got) == len(expected)
+            and np.array_equal(store.coords[got], model.coords[expected])
+            and np.array_equal(store.style[got], model.style[expected])
+            and np.array_equal(store.flags[got] & FILL, model.flags[expected] & FILL)
+            and [s.text for s in result.shapes if store.kind[s.row] == TEXT] == [texts[i] for i in order if i in texts])
+
+    print(f"Операцій: {result.operations} (записано {total}), фігур наприкінці: {len(result.shapes)}")
+    print(f"Запис:       {write:6.2f} с ({write / total * 1e6:.1f} мкс/операцію), журнал {size / 1e6:.1f} МБ "
+          f"({size / total:.0f} байт/операцію)")
+    print(f"Відтворення: {elapsed:6.2f} с ({result.operations / elapsed / 1e6:.2f} млн операцій/с)")
+    print("Сцена збігається з моделлю" if same else "УВАГА: сцена відрізняється від моделі")
+    os.remove(path)
+
+if __name__ == "__main__":
+    main()
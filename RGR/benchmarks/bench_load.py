@@ -0,0 +1,78 @@
+"""Перетворення записів документа у фігури: по одній (конструктор, QPoint, розбір
+стилю на кожну фігуру) проти масового Shape.from_records.
+Запуск: python benchmarks/bench_load.py [кількість]"""
+import gc
+import os
+import sys
+import time
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PyQt5.QtCore import Qt, QPoint
+from styles import styles
+from shapes import Shape, Rectangle, Ellipse, Line, Triangle, Arrow, TextShape
+
+TYPES = ['rectangle', 'ellipse', 'line', 'triangle', 'arrow', 'text']
+COLORS = [0xff000000, 0xffc81e1e, 0xff1e78c8, 0xff14a03c]
+
+def make_records(n):
+    # Як у файлі: координати, кольори як ARGB, у трикутників - збережені вершини
+    result = []
+    for i in range(n):
+        x, y = (i * 37) % 5000, (i * 91) % 5000
+        d = {'type': TYPES[i % len(TYPES)], 'start': {'x': x, 'y': y},
+             'end': {'x': x + 20 + i % 50, 'y': y + 15 + i % 40},
+             'color': COLORS[i % len(COLORS)], 'fill_color': 0xffffff00 if i % 7 == 0 else 0,
+             'line_width': 1 + i % 3, 'line_style': 1}
+        if d['type'] == 'triangle':
+            d.update({'point_a': {'x': x, 'y': y + 30}, 'point_b': {'x': x + 40, 'y': y + 30},
+                      'point_c': {'x': x + 20, 'y': y}})
+        elif d['type'] == 'text':
+            d.update({'text': f"Підпис {i}", 'font_size': 12, 'font_family': 'Arial'})
+        result.append(d)
+    return result
+
+LEGACY_CLASSES = {'rectangle': Rectangle, 'ellipse': Ellipse, 'line': Line,
+                  'triangle': Triangle, 'arrow': Arrow, 'text': TextShape}
+
+def legacy_from_dict(data):
+    # Так читали фігури до реєстру: конструктор (з calculate_third_point), потім перезапис полів
+    cls = LEGACY_CLASSES.get(data['type'])
+    if cls is None: return None
+    obj = cls(QPoint(data['start']['x'], data['start']['y']), QPoint(data['end']['x'], data['end']['y']))
+    if cls is TextShape: obj.text = data.get('text', 'Текст')
+    if cls is Triangle and 'point_a' in data:
+        obj.a = QPoint(data['point_a']['x'], data['point_a']['y'])
+        obj.b = QPoint(data['point_b']['x'], data['point_b']['y'])
+        obj.c = QPoint(data['point_c']['x'], data['point_c']['y'])
+    base = obj.style
+    family, size = base.font_family, base.font_size
+    if family is not None:
+        family, size = data.get('font_family', family), data.get('font_size', size)
+    obj.style = styles.intern_key((data['color'] & 0xffffffff, data['fill_color'] & 0xffffffff,
+                                   data['line_width'], int(data.get('line_style', Qt.SolidLine)), family, size))
+    obj.fill_enabled = obj.fill_color.alpha() > 0
+    return obj
+
+def timed(func):
+    gc.collect()
+    t = time.perf_counter()
+    result = func()
+    return time.perf_counter() - t, result
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    records = make_records(n)
+    print(f"Фігур: {n}")
+    old, legacy = timed(lambda: [legacy_from_dict(d) for d in records])
+    print(f"По одній:     {old:6.2f} с ({old / n * 1e6:.1f} мкс/фігуру)")
+    expected = [s.to_dict() for s in legacy]
+    del legacy
+    new, shapes = timed(lambda: Shape.from_records(records))
+    print(f"from_records: {new:6.2f} с ({new / n * 1e6:.1f} мкс/фігуру), прискорення x{old / new:.1f}")
+    same = [s.to_dict() for s in shapes] == expected
+    print("Фігури однакові" if same else "УВАГА: фігури відрізняються")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""Порівняння малювання кадру: старий шлях (нові QPen/QBrush/QFont на кожну фігуру)
+проти спільних стилів з таблиці. Запуск: python benchmarks/bench_styles.py [кількість]"""
+import os
+import sys
+import time
+import tracemalloc
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PyQt5.QtWidgets import QApplication
+from PyQt5.QtCore import Qt, QPoint
+from PyQt5.QtGui import QPainter, QImage, QPen, QBrush, QColor, QFont
+import shapes
+from shapes import Rectangle, Ellipse, TextShape
+
+class Counter:
+    """Підраховує створення Qt-об'єктів стилю під час кадру"""
+    def __init__(self):
+        self.count = 0
+    def wrap(self, cls):
+        counter = self
+        def make(*args):
+            counter.count += 1
+            return cls(*args)
+        return make
+
+def legacy_draw(shape, painter, new):
+    # Так малювали фігури до таблиці стилів
+    if isinstance(shape, TextShape):
+        painter.setPen(new['QPen'](shape.color, 1))
+        painter.setFont(new['QFont'](shape.font_family, shape.font_size))
+        painter.drawText(shape.get_bounding_rect(), Qt.AlignCenter | Qt.TextWordWrap, shape.text)
+        return
+    painter.setPen(new['QPen'](shape.color, shape.line_width, shape.line_style))
+    painter.setBrush(new['QBrush'](shape.fill_color) if shape.fill_enabled else Qt.NoBrush)
+    if isinstance(shape, Ellipse): painter.drawEllipse(shape.get_bounding_rect())
+    else: painter.drawRect(shape.get_bounding_rect())
+
+def make_scene(n):
+    palette = [QColor(0, 0, 0), QColor(200, 0, 0), QColor(0, 0, 200)]
+    result = []
+    for i in range(n):
+        x, y = (i * 37) % 1900, (i * 53) % 1900
+        cls = (Rectangle, Ellipse, TextShape)[i % 3]
+        s = cls(QPoint(x, y), QPoint(x + 60, y + 40))
+        s.set_color(palette[i % len(palette)])
+        result.append(s)
+    return result
+
+def frame(scene, legacy, counter):
+    image = QImage(2000, 2000, QImage.Format_ARGB32_Premultiplied)
+    image.fill(Qt.white)
+    painter = QPainter(image)
+    new = {name: counter.wrap(cls) for name, cls in (('QPen', QPen), ('QBrush', QBrush), ('QFont', QFont))}
+    t = time.perf_counter()
+    for s in scene:
+        if legacy: legacy_draw(s, painter, new)
+        else: s.draw(painter)
+    elapsed = time.perf_counter() - t
+    painter.end()
+    return elapsed
+
+def shape_memory(n, legacy):
+    # Пам'ять на фігуру: старі фігури тримали два власні QColor
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    scene = make_scene(n)
+    extra = [(QColor(s.color), QColor(s.fill_color)) for s in scene] if legacy else None
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    del scene, extra
+    return used / n
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    app = QApplication(sys.argv)
+    scene = make_scene(n)
+    print(f"Фігур: {n}, стилів у таблиці: {len(shapes.styles)}")
+    for legacy in (True, False):
+        counter = Counter()
+        # Спільні стилі: рахуємо також реальні конструктори в модулі shapes
+        shapes.QPen, shapes.QBrush, shapes.QFont = counter.wrap(QPen), counter.wrap(QBrush), counter.wrap(QFont)
+        frame(scene, legacy, counter)  # прогрів (ліниві QFont)
+        counter.count = 0
+        elapsed = frame(scene, legacy, counter)
+        shapes.QPen, shapes.QBrush, shapes.QFont = QPen, QBrush, QFont
+        name = "до (нові об'єкти)" if legacy else "після (спільні стилі)"
+        print(f"{name:24} кадр {elapsed * 1000:8.1f} мс, "
+              f"створено QPen/QBrush/QFont за кадр: {counter.count}, "
+              f"пам'ять на фігуру: {shape_memory(n, legacy):.0f} Б")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""Час кадру для сцени з підписів: розбивка тексту на кожному кадрі (drawText)
+проти закешованого макета QStaticText. Запуск: python benchmarks/bench_text.py [кількість] [повторів]"""
+import os
+import statistics
+import sys
+import time
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PyQt5.QtWidgets import QApplication
+from PyQt5.QtCore import Qt, QPoint
+from PyQt5.QtGui import QPainter, QImage
+from shapes import TextShape
+
+LABELS = ['Вузол', 'Клапан подачі', 'Насос високого тиску №2', 'Датчик температури на виході']
+
+def make_scene(n):
+    result = []
+    for i in range(n):
+        x, y = (i % 14) * 140, (i // 14) * 70 % 1900
+        s = TextShape(QPoint(x, y), QPoint(x + 130, y + 64))
+        s.text = LABELS[i % len(LABELS)]
+        s.set_font_size(10 + i % 3)
+        result.append(s)
+    return result
+
+def legacy_paint(s, painter):
+    # Так малювали підписи до кешу макета
+    painter.setPen(s.style.text_pen)
+    painter.setFont(s.style.font)
+    painter.drawText(s.get_bounding_rect(), Qt.AlignCenter | Qt.TextWordWrap, s.text)
+
+def frame(scene, legacy, image):
+    image.fill(Qt.white)
+    painter = QPainter(image)
+    t = time.perf_counter()
+    for s in scene:
+        if legacy: legacy_paint(s, painter)
+        else: s.paint(painter)
+    elapsed = time.perf_counter() - t
+    painter.end()
+    return elapsed
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 21
+    app = QApplication(sys.argv)
+    scene = make_scene(n)
+    img1 = QImage(2000, 2000, QImage.Format_ARGB32_Premultiplied)
+    img2 = QImage(2000, 2000, QImage.Format_ARGB32_Premultiplied)
+    # Прогрів: кеш гліфів і шрифтів Qt, макети QStaticText - перший кадр обох шляхів не рахуємо
+    frame(scene, True, img1)
+    frame(scene, False, img2)
+    # Шляхи чергуються, щоб дрейф частоти процесора і фонові процеси впливали на обидва однаково
+    old, new = [], []
+    for i in range(repeats):
+        order = [(True, img1, old), (False, img2, new)]
+        if i % 2: order.reverse()
+        for legacy, image, times in order:
+            times.append(frame(scene, legacy, image))
+    old, new = statistics.median(old), statistics.median(new)
+    print(f"Підписів: {n}, повторів: {repeats} (медіана)")
+    print(f"drawText:    {old * 1000:8.1f} мс")
+    print(f"QStaticText: {new * 1000:8.1f} мс, прискорення x{old / new:.2f}")
+    print("Зображення однакові" if img1 == img2 else "УВАГА: зображення відрізняються")
+
+if __name__ == "__main__":
+    main()
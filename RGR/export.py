@@ -0,0 +1,149 @@
+"""Пакетний експорт малюнків .json у PNG, SVG і PDF без вікна.
+Кожен документ обробляється окремим процесом пулу.
+
+Запуск: python export.py [-f png,svg,pdf] [-o тека] [-j процесів] [-s масштаб] файли..."""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import get_context
+
+# Рендеринг без дисплея - до будь-якого імпорту Qt
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+from PyQt5.QtCore import Qt, QRect, QPoint, QSize, QSizeF, QMarginsF
+from PyQt5.QtGui import QGuiApplication, QImage, QPainter, QColor, QPdfWriter, QPageSize, QPageLayout
+from PyQt5.QtSvg import QSvgGenerator
+from styles import styles
+from renderer import Renderer
+from files import FileManager
+
+FORMATS = ('png', 'svg', 'pdf')
+
+_app = None # QGuiApplication процесу-обробника
+
+def init_worker():
+    global _app
+    _app = QGuiApplication.instance() or QGuiApplication([sys.argv[0]])
+
+def document_rect(shapes, margin):
+    # Світова область, що охоплює всі фігури (з пером і наконечниками стрілок)
+    if not shapes: return QRect(0, 0, 100, 100)
+    store = shapes[0].store
+    b = store.paint_bounds([s.row for s in shapes], styles.line_widths())
+    rect = QRect(QPoint(int(b[:, 0].min()), int(b[:, 1].min())), QPoint(int(b[:, 2].max()), int(b[:, 3].max())))
+    return rect.adjusted(-margin, -margin, margin, margin)
+
+def paint_document(painter, shapes, rect, scale):
+    painter.scale(scale, scale)
+    painter.translate(-rect.x(), -rect.y())
+    # Експорт завжди з повною деталізацією
+    Renderer(dot_size=0, simple_size=0, text_size=0).draw(painter, shapes)
+    painter.end()
+
+def export_png(shapes, rect, scale, path, background):
+    image = QImage(max(1, round(rect.width() * scale)), max(1, round(rect.height() * scale)),
+                   QImage.Format_ARGB32_Premultiplied)
+    image.fill(QColor(background) if background else Qt.transparent)
+    paint_document(QPainter(image), shapes, rect, scale)
+    if not image.save(path): raise OSError(f"не вдалося записати {path}")
+
+def export_svg(shapes, rect, scale, path, background):
+    size = QSize(max(1, round(rect.width() * scale)), max(1, round(rect.height() * scale)))
+    svg = QSvgGenerator()
+    svg.setFileName(path)
+    svg.setSize(size)
+    svg.setViewBox(QRect(0, 0, size.width(), size.height()))
+    svg.setTitle(os.path.basename(path))
+    painter = QPainter(svg)
+    if background: painter.fillRect(0, 0, size.width(), size.height(), QColor(background))
+    paint_document(painter, shapes, rect, scale)
+
+def export_pdf(shapes, rect, scale, path, background):
+    pdf = QPdfWriter(path)
+    pdf.setResolution(72) # одиниця малювання - типографський пункт
+    size = QSizeF(max(1, rect.width() * scale), max(1, rect.height() * scale))
+    pdf.setPageSize(QPageSize(size, QPageSize.Point, "", QPageSize.ExactMatch))
+    pdf.setPageMargins(QMarginsF(0, 0, 0, 0), QPageLayout.Point)
+    painter = QPainter(pdf)
+    if background: painter.fillRect(0, 0, round(size.width()), round(size.height()), QColor(background))
+    paint_document(painter, shapes, rect, scale)
+
+EXPORTERS = {'png': export_png, 'svg': export_svg, 'pdf': export_pdf}
+
+def output_base(filename, out_dir):
+    # Шлях результату без розширення: тека виводу (або тека документа) та ім'я документа
+    return os.path.join(out_dir or os.path.dirname(os.path.abspath(filename)),
+                        os.path.splitext(os.path.basename(filename))[0])
+
+def output_conflicts(files, out_dir):
+    # Документи, результати яких мали б однаковий шлях (a/x.json і b/x.json з -o, x.json і x.vgb)
+    by_base = {}
+    for f in files:
+        by_base.setdefault(os.path.normcase(os.path.abspath(output_base(f, out_dir))), []).append(f)
+    return [group for group in by_base.values() if len(group) > 1]
+
+def export_file(filename, formats, out_dir, scale, margin, background):
+    # Обробка одного документа в процесі пулу; повертає словник зі статистикою
+    t0 = time.perf_counter()
+    shapes = FileManager.read(filename)
+    t1 = time.perf_counter()
+    rect = document_rect(shapes, margin)
+    base = output_base(filename, out_dir)
+    outputs = []
+    for fmt in formats:
+        path = f"{base}.{fmt}"
+        EXPORTERS[fmt](shapes, rect, scale, path, background)
+        outputs.append(path)
+    t2 = time.perf_counter()
+    return {'file': filename, 'shapes': len(shapes), 'load': t1 - t0, 'render': t2 - t1, 'outputs': outputs}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Пакетний експорт малюнків RGR у PNG/SVG/PDF")
+    parser.add_argument('files', nargs='+', help="файли .json")
+    parser.add_argument('-f', '--formats', default='png', help="через кому: png,svg,pdf (типово png)")
+    parser.add_argument('-o', '--out', help="тека для результатів (типово поруч з файлом)")
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count(), help="кількість процесів")
+    parser.add_argument('-s', '--scale', type=float, default=1.0, help="масштаб (пікселів на одиницю)")
+    parser.add_argument('-m', '--margin', type=int, default=10, help="поле навколо малюнка")
+    parser.add_argument('-b', '--background', default='white', help="колір фону; '' - прозорий (PNG)")
+    args = parser.parse_args(argv)
+
+    formats = [f.strip().lower() for f in args.formats.split(',') if f.strip()]
+    unknown = [f for f in formats if f not in FORMATS]
+    if unknown: parser.error(f"невідомий формат: {', '.join(unknown)}")
+    # Той самий файл, названий двічі, експортуємо один раз; різні файли з одним ім'ям
+    # результату перезаписали б один одного - таке відхиляємо до початку роботи
+    files = list({os.path.normcase(os.path.abspath(f)): f for f in args.files}.values())
+    conflicts = output_conflicts(files, args.out)
+    if conflicts:
+        parser.error("однакові імена результатів: " + "; ".join(", ".join(group) for group in conflicts))
+    if args.out: os.makedirs(args.out, exist_ok=True)
+
+    started = time.perf_counter()
+    done = failed = total_shapes = 0
+    # spawn: процеси не успадковують стан Qt батька
+    with ProcessPoolExecutor(max_workers=max(1, args.jobs), mp_context=get_context('spawn'),
+                             initializer=init_worker) as pool:
+        futures = {pool.submit(export_file, f, formats, args.out, args.scale, args.margin, args.background): f
+                   for f in files}
+        for future in as_completed(futures):
+            try:
+                r = future.result()
+            except Exception as e:
+                failed += 1
+                print(f"ПОМИЛКА {futures[future]}: {e}", file=sys.stderr)
+                continue
+            done += 1
+            total_shapes += r['shapes']
+            print(f"{r['file']}: {r['shapes']} фігур, читання {r['load'] * 1000:.0f} мс, "
+                  f"рендер {r['render'] * 1000:.0f} мс -> {', '.join(os.path.basename(p) for p in r['outputs'])}")
+
+    elapsed = time.perf_counter() - started
+    print(f"Готово: {done} файлів, помилок: {failed}, {elapsed:.2f} с, "
+          f"{done / elapsed:.1f} файлів/с, {total_shapes / elapsed:.0f} фігур/с")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
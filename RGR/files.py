@@ -1,44 +1,444 @@
+import codecs
 import json
-from PyQt5.QtWidgets import QFileDialog, QMessageBox
-from shapes import Shape
+import mmap
+import os
+import struct
+import sys
+from contextlib import contextmanager
+import numpy as np
+from PyQt5.QtCore import Qt, QObject, QRunnable, QThreadPool, pyqtSignal
+from PyQt5.QtWidgets import QFileDialog, QMessageBox, QProgressDialog
+from shapes import Shape, SHAPE_CLASSES
+from styles import styles
+from store import default_store, KIND_CODES, ALIVE, FILL
+
+FILE_FILTER = "Малюнки (*.json *.vgb);;JSON (*.json);;Двійковий малюнок (*.vgb)"
+
+class Cancelled(Exception):
+    """Користувач скасував читання чи запис"""
+
+class ShapeStreamReader:
+    """Потокове читання документа: фігури з масиву "shapes" по одній.
+    У пам'яті лише невеликий буфер, тож пікове споживання не залежить від розміру файлу"""
+
+    CHUNK = 1 << 20
+
+    def __init__(self, f):
+        self.f = f
+        self.decoder = codecs.getincrementaldecoder('utf-8')()
+        self.json = json.JSONDecoder()
+        self.buf = ''
+        self.pos = 0
+        self.base = 0 # скільки символів файлу відкинуто з буфера - для позицій у помилках
+        self.eof = False
+        self.meta = {} # інші ключі верхнього рівня (version...)
+
+    def fill(self):
+        # Дочитуємо наступний шматок, відкидаючи вже розібране
+        if self.eof: return False
+        data = self.f.read(self.CHUNK)
+        self.eof = not data
+        self.base += self.pos
+        self.buf = self.buf[self.pos:] + self.decoder.decode(data, final=self.eof)
+        self.pos = 0
+        return not self.eof
+
+    def skip_ws(self):
+        while True:
+            buf, pos = self.buf, self.pos
+            while pos < len(buf) and buf[pos] in ' \t\r\n': pos += 1
+            self.pos = pos
+            if pos < len(buf) or not self.fill(): return
+
+    def peek(self):
+        self.skip_ws()
+        return self.buf[self.pos] if self.pos < len(self.buf) else ''
+
+    def offset(self, pos=None):
+        # Позиція у файлі (у символах) - f.tell() показував би кінець уже прочитаного шматка
+        return self.base + (self.pos if pos is None else pos)
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise ValueError(f"Очікувалось '{char}' у позиції {self.offset()}")
+        self.pos += 1
+
+    def value(self):
+        # Одне JSON-значення; якщо воно обірване кінцем буфера - дочитуємо
+        self.skip_ws()
+        while True:
+            try:
+                value, end = self.json.raw_decode(self.buf, self.pos)
+                # Число в кінці буфера могло бути обрізане
+                if end < len(self.buf) or self.eof:
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError as e:
+                if self.eof:
+                    raise ValueError(f"{e.msg} у позиції {self.offset(e.pos)}") from None
+            self.fill()
+
+    def __iter__(self):
+        self.expect('{')
+        while self.peek() != '}':
+            key = self.value()
+            self.expect(':')
+            if key == 'shapes':
+                self.expect('[')
+                while self.peek() != ']':
+                    yield self.value()
+                    if self.peek() == ',': self.pos += 1
+                self.pos += 1
+            else:
+                self.meta[key] = self.value()
+            if self.peek() == ',': self.pos += 1
+        self.pos += 1
+
+@contextmanager
+def replace_file(filename, mode='w', **kwargs):
+    # Запис у тимчасовий файл і атомарна заміна цілі лише після успіху.
+    # fsync до заміни: після збою на диску або старий файл, або новий повністю
+    tmp = filename + '.part'
+    try:
+        with open(tmp, mode, **kwargs) as f:
+            yield f
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, filename)
+    except BaseException:
+        if os.path.exists(tmp): os.remove(tmp)
+        raise
+
+# --- Двійковий формат .vgb ---
+# Заголовок, таблиця стилів, записи фігур фіксованої довжини і купа рядків UTF-8
+# (тексти, назви шрифтів). Усі числа little-endian, записи вирівняні на 8 байт
+VGB_MAGIC = b'VGB1'
+VGB_VERSION = 1
+VGB_HEADER = struct.Struct('<4sHHIII') # сигнатура, версія, розмір запису, фігур, стилів, байт у купі
+VGB_STYLE = struct.Struct('<IIHHhxxII') # колір, заливка, товщина, тип лінії, розмір шрифту, шрифт (зсув, довжина)
+VGB_RECORD = np.dtype([('kind', 'u1'), ('flags', 'u1'), ('pad', '<u2'), ('style', '<u4'),
+                       ('coords', '<i4', (10,)), ('text', '<u4'), ('text_len', '<u4')])
+NO_STRING = 0xffffffff
+TEXT = KIND_CODES['text']
+
+def vgb_align(pos):
+    return (pos + 7) & ~7
+
+class VgbDocument:
+    """Документ .vgb, відображений у пам'ять. Записи - масив NumPy прямо над mmap,
+    тож відкриття нічого не розбирає, крім перевірки; фігури будуються одним проходом
+    у shapes() (полотну для індексу все одно потрібні всі одразу)"""
+
+    def __init__(self, filename):
+        self.records = None
+        with open(filename, 'rb') as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            self.parse()
+        except Exception:
+            self.close()
+            raise
+
+    def parse(self):
+        mm = self.mm
+        if len(mm) < VGB_HEADER.size: raise ValueError("Файл пошкоджено")
+        magic, version, record_size, count, style_count, heap_size = VGB_HEADER.unpack_from(mm, 0)
+        if magic != VGB_MAGIC or version != VGB_VERSION or record_size != VGB_RECORD.itemsize:
+            raise ValueError("Невідомий формат файлу")
+        pos = VGB_HEADER.size
+        table_end = pos + style_count * VGB_STYLE.size
+        self.heap = vgb_align(table_end) + count * record_size
+        if self.heap + heap_size > len(mm): raise ValueError("Файл пошкоджено")
+        table = list(VGB_STYLE.iter_unpack(mm[pos:table_end]))
+        pos = vgb_align(table_end)
+        self.records = np.frombuffer(mm, VGB_RECORD, count, pos)
+        # Перевіряємо все до створення стилів і фігур
+        if count:
+            if int(self.records['style'].max()) >= len(table): raise ValueError("Файл пошкоджено")
+            if np.setdiff1d(self.records['kind'], list(SHAPE_CLASSES)).size: raise ValueError("Невідомий тип фігури")
+        # Стилі файлу -> id у спільній таблиці стилів
+        self.style_ids = np.array([styles.intern_key((color, fill, width, line_style,
+                                                      self.string(family, family_len),
+                                                      None if size < 0 else size)).id
+                                   for color, fill, width, line_style, size, family, family_len in table], np.int32)
+
+    def string(self, offset, length):
+        if offset == NO_STRING: return None
+        start = self.heap + offset
+        return self.mm[start:start + length].decode('utf-8')
+
+    def __len__(self):
+        return len(self.records)
+
+    def shapes(self, progress=None):
+        # Усі фігури: колонки сховища заповнюються цілими масивами, об'єкти - лише представлення
+        rec = self.records
+        store = default_store
+        n = len(rec)
+        rows = store.allocate_many(rec['kind'])
+        store.coords[rows] = rec['coords']
+        store.style[rows] = self.style_ids[rec['style']]
+        store.flags[rows] = ALIVE | (rec['flags'] & FILL)
+        kinds = rec['kind'].tolist()
+        texts = {i: self.string(int(rec['text'][i]), int(rec['text_len'][i])) or ""
+                 for i in np.flatnonzero(rec['kind'] == TEXT).tolist()}
+        del rec # далі - без масивів над mmap, щоб документ можна було закрити
+        result = []
+        try:
+            for i, (row, kind) in enumerate(zip(rows.tolist(), kinds)):
+                if i % FileManager.PROGRESS_STEP == 0 and progress and progress(i, n) is False:
+                    raise Cancelled()
+                cls = SHAPE_CLASSES[kind]
+                result.append(cls.view(store, row, texts[i]) if kind == TEXT else cls.view(store, row))
+        except BaseException:
+            # Рядки без представлень повертаємо сховищу
+            for row in rows[len(result):].tolist(): store.release(row)
+            raise
+        return result
+
+    def close(self):
+        # Масиви над mmap треба відпустити до закриття
+        self.records = None
+        self.mm.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class Snapshot:
+    """Незалежна копія фігур для роботи у фоні (запис файлу, плитки полотна):
+    скопійовані колонки сховища і тексти. Знімається в потоці інтерфейсу кількома
+    копіюваннями масивів; об'єкти фігур будуються вже в робочому потоці, тож
+    редагування на них не впливає"""
+
+    def __init__(self, shapes):
+        store = shapes[0].store if shapes else default_store
+        rows = np.fromiter((s.row for s in shapes), np.intp, len(shapes))
+        self.store = store.snapshot(rows)
+        self.texts = {i: shapes[i].text for i in np.flatnonzero(store.kind[rows] == TEXT).tolist()}
+
+    def __len__(self):
+        return self.store.size
+
+    def shapes(self):
+        # Представлення рядків копії (рядки 0..n-1)
+        store, texts = self.store, self.texts
+        return [SHAPE_CLASSES[kind].view(store, i, texts[i]) if kind == TEXT else SHAPE_CLASSES[kind].view(store, i)
+                for i, kind in enumerate(store.kind[:store.size].tolist())]
+
+class SaveJob(QRunnable):
+    """Запис знімка документа у робочому потоці"""
+
+    def __init__(self, saver, snapshot, filename, number):
+        super().__init__()
+        self.saver = saver
+        self.snapshot = snapshot
+        self.filename = filename
+        self.number = number # порядковий номер запису - для скасування
+
+    def run(self):
+        saver = self.saver
+        try:
+            FileManager.write(self.snapshot.shapes(), self.filename, self.progress)
+        except Cancelled:
+            saver.cancelled.emit(self.filename)
+        except Exception as e:
+            saver.failed.emit(self.filename, str(e))
+        else:
+            saver.saved.emit(self.filename)
+
+    def progress(self, done, total):
+        # False перериває запис; тимчасовий файл видаляється, документ на диску не змінюється
+        if self.number <= self.saver.cancelled_upto: return False
+        self.saver.progress.emit(done, total)
+
+class BackgroundSaver(QObject):
+    """Збереження без блокування вікна: знімок у потоці інтерфейсу, серіалізація і запис -
+    в окремому потоці. Збереження виконуються по черзі, ціль замінюється атомарно"""
+
+    progress = pyqtSignal(int, int) # зроблено, всього
+    saved = pyqtSignal(str)
+    failed = pyqtSignal(str, str)   # файл, повідомлення
+    cancelled = pyqtSignal(str)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(1)
+        self.active = 0
+        self.started = 0       # скільки записів поставлено в чергу
+        self.cancelled_upto = 0 # записи з номером до цього включно скасовано
+        self.saved.connect(self.on_finished)
+        self.failed.connect(self.on_finished)
+        self.cancelled.connect(self.on_finished)
+
+    def save(self, shapes, filename):
+        self.active += 1
+        self.started += 1
+        self.pool.start(SaveJob(self, Snapshot(shapes), filename, self.started))
+
+    def cancel(self):
+        # Скасувати всі поставлені записи; нові після цього виконуються як звичайно
+        self.cancelled_upto = self.started
+
+    def on_finished(self, *args):
+        self.active -= 1
+
+    def busy(self):
+        return self.active > 0
+
+    def wait(self):
+        # Дочекатись усіх записів (закриття вікна)
+        self.pool.waitForDone()
 
 class FileManager:
+    PROGRESS_STEP = 1024 # як часто (у фігурах) повідомляти про прогрес
+
     @staticmethod
-    def save(shapes, filename, parent):
-        if not filename:
-            filename, _ = QFileDialog.getSaveFileName(parent, "Зберегти", "", "JSON (*.json)")
-        
-        if filename:
-            try:
-                if not filename.endswith('.json'): filename += '.json'
-                
-                data = {
-                    'shapes': [s.to_dict() for s in shapes],
-                    'version': '1.0'
-                }
-                
-                with open(filename, 'w', encoding='utf-8') as f:
-                    json.dump(data, f, indent=2)
-                return True, filename
-            except Exception as e:
-                QMessageBox.critical(parent, "Помилка", str(e))
-        return False, None
+    def is_binary(filename):
+        return os.path.splitext(filename)[1].lower() == '.vgb'
+
+    @staticmethod
+    def write(shapes, filename, progress=None):
+        # Формат - за розширенням. progress(зроблено, всього) повертає False, щоб скасувати
+        if FileManager.is_binary(filename):
+            FileManager.write_vgb(shapes, filename, progress)
+        else:
+            FileManager.write_json(shapes, filename, progress)
+
+    @staticmethod
+    def read(filename, progress=None):
+        # Читання без діалогів - для вікна і для пакетного експорту
+        if FileManager.is_binary(filename):
+            return FileManager.read_vgb(filename, progress)
+        return FileManager.read_json(filename, progress)
+
+    @staticmethod
+    def write_json(shapes, filename, progress=None):
+        # Потоковий запис: одна фігура за раз, по рядку на фігуру.
+        # Пишемо в тимчасовий файл, щоб скасування не зіпсувало наявний документ
+        total = len(shapes)
+        with replace_file(filename, 'w', encoding='utf-8') as f:
+            f.write('{\n  "version": "1.0",\n  "shapes": [')
+            for i, s in enumerate(shapes):
+                if i % FileManager.PROGRESS_STEP == 0 and progress and progress(i, total) is False:
+                    raise Cancelled()
+                f.write(',\n    ' if i else '\n    ')
+                f.write(json.dumps(s.to_dict(), ensure_ascii=False))
+            f.write('\n  ]\n}\n')
+        if progress: progress(total, total)
+
+    @staticmethod
+    def read_json(filename, progress=None):
+        # progress(прочитано байт, розмір файлу).
+        # Записи збираються пачками і перетворюються у фігури масово (Shape.from_records)
+        total = os.path.getsize(filename)
+        shapes = []
+        batch = []
+        with open(filename, 'rb') as f:
+            for item in ShapeStreamReader(f):
+                batch.append(item)
+                if len(batch) == FileManager.PROGRESS_STEP:
+                    shapes += Shape.from_records(batch)
+                    batch.clear()
+                    if progress and progress(f.tell(), total) is False:
+                        raise Cancelled()
+            shapes += Shape.from_records(batch)
+        if progress: progress(total, total)
+        return shapes
+
+    @staticmethod
+    def write_vgb(shapes, filename, progress=None):
+        # Колонки сховища копіюються в записи цілими масивами; по одній обробляються лише тексти
+        total = len(shapes)
+        if progress and progress(0, total) is False: raise Cancelled()
+        store = shapes[0].store if shapes else default_store
+        rows = np.fromiter((s.row for s in shapes), np.intp, total)
+        used, local = np.unique(store.style[rows], return_inverse=True)
+        records = np.zeros(total, VGB_RECORD)
+        records['kind'] = store.kind[rows]
+        records['flags'] = store.flags[rows] & FILL
+        records['style'] = local
+        records['coords'] = store.coords[rows]
+        records['text'] = NO_STRING
+
+        heap = bytearray()
+        def put(text):
+            if text is None: return NO_STRING, 0
+            data = text.encode('utf-8')
+            heap.extend(data)
+            return len(heap) - len(data), len(data)
+
+        table = []
+        for style_id in used.tolist():
+            color, fill, width, line_style, family, size = styles.by_id[style_id].key
+            table.append(VGB_STYLE.pack(color, fill, width, line_style, -1 if size is None else size, *put(family)))
+        text_rows = np.flatnonzero(records['kind'] == TEXT)
+        spans = []
+        for n, i in enumerate(text_rows.tolist()):
+            if n % FileManager.PROGRESS_STEP == 0 and progress and progress(n, total) is False:
+                raise Cancelled()
+            spans.append(put(shapes[i].text))
+        if spans:
+            records['text'][text_rows], records['text_len'][text_rows] = np.array(spans, np.uint32).T
+
+        with replace_file(filename, 'wb') as f:
+            f.write(VGB_HEADER.pack(VGB_MAGIC, VGB_VERSION, VGB_RECORD.itemsize, total, len(table), len(heap)))
+            f.write(b''.join(table))
+            f.write(bytes(vgb_align(f.tell()) - f.tell()))
+            f.write(records.tobytes())
+            f.write(heap)
+        if progress: progress(total, total)
+
+    @staticmethod
+    def read_vgb(filename, progress=None):
+        with VgbDocument(filename) as doc:
+            shapes = doc.shapes(progress)
+        if progress: progress(len(shapes), len(shapes))
+        return shapes
+
+    @staticmethod
+    def convert(source, target, progress=None):
+        # JSON <-> .vgb (формат кожного файлу - за розширенням)
+        FileManager.write(FileManager.read(source, progress), target, progress)
+
+    @staticmethod
+    def progress_dialog(parent, title):
+        # Модальний прогрес зі скасуванням; setValue сам обробляє події вікна
+        dialog = QProgressDialog(title, "Скасувати", 0, 1000, parent)
+        dialog.setWindowModality(Qt.WindowModal)
+        dialog.setMinimumDuration(500)
+        def progress(done, total):
+            dialog.setValue(int(done * 1000 / total) if total else 1000)
+            return not dialog.wasCanceled()
+        return dialog, progress
+
+    @staticmethod
+    def ask_save_filename(parent):
+        filename, selected = QFileDialog.getSaveFileName(parent, "Зберегти", "", FILE_FILTER)
+        if filename and os.path.splitext(filename)[1].lower() not in ('.json', '.vgb'):
+            filename += '.vgb' if '*.vgb)' in selected and '*.json' not in selected else '.json'
+        return filename
 
     @staticmethod
     def load(parent):
-        filename, _ = QFileDialog.getOpenFileName(parent, "Відкрити", "", "JSON (*.json)")
-        
+        filename, _ = QFileDialog.getOpenFileName(parent, "Відкрити", "", FILE_FILTER)
+
         if filename:
+            dialog, progress = FileManager.progress_dialog(parent, "Відкриття...")
             try:
-                with open(filename, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                
-                shapes = []
-                for item in data['shapes']:
-                    s = Shape.from_dict(item)
-                    if s: shapes.append(s)
-                    
-                return shapes, filename
+                return FileManager.read(filename, progress), filename
+            except Cancelled:
+                pass
             except Exception as e:
                 QMessageBox.critical(parent, "Помилка", str(e))
-        return None, None
\ No newline at end of file
+            finally:
+                dialog.close()
+        return None, None
+
+if __name__ == "__main__":
+    # Перетворення між форматами: python files.py вхідний.json вихідний.vgb
+    if len(sys.argv) != 3: sys.exit("Використання: python files.py вхідний вихідний (.json або .vgb)")
+    FileManager.convert(sys.argv[1], sys.argv[2])
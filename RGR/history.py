@@ -0,0 +1,191 @@
+import numpy as np
+from store import FILL
+
+# Оцінка пам'яті на посилання на фігуру в команді (об'єкт-представлення + запис у списку)
+SHAPE_REF_BYTES = 16
+
+class Command:
+    """Базова команда журналу скасування: зберігає лише різницю"""
+
+    gesture = None # id жесту миші - команди одного жесту зливаються
+
+    def undo(self, canvas): pass
+    def redo(self, canvas): pass
+
+    def merge(self, other):
+        # Спробувати влити наступну команду в цю (True - злито)
+        return False
+
+    def nbytes(self):
+        return 64
+
+class AddShapes(Command):
+    def __init__(self, shapes, ids, zs):
+        self.shapes = list(shapes)
+        self.ids = np.asarray(ids, np.int64)
+        self.zs = np.asarray(zs, np.float64)
+
+    def undo(self, canvas):
+        canvas.remove_shapes(self.shapes)
+
+    def redo(self, canvas):
+        canvas.insert_shapes(self.shapes, self.ids.tolist(), self.zs.tolist())
+
+    def nbytes(self):
+        return 64 + self.ids.nbytes + self.zs.nbytes + SHAPE_REF_BYTES * len(self.shapes)
+
+class DeleteShapes(AddShapes):
+    # Видалення - дзеркальне додавання; фігури живуть у команді до витіснення
+    def undo(self, canvas):
+        super().redo(canvas)
+
+    def redo(self, canvas):
+        super().undo(canvas)
+
+class MoveShapes(Command):
+    def __init__(self, shapes, rows, dx, dy, gesture=None):
+        self.shapes = list(shapes)
+        self.rows = rows
+        self.dx, self.dy = dx, dy
+        self.gesture = gesture
+
+    def undo(self, canvas):
+        # Один векторизований зсув для всіх фігур
+        canvas.modify_shapes(self.shapes, lambda: canvas.store.move(self.rows, -self.dx, -self.dy))
+
+    def redo(self, canvas):
+        canvas.modify_shapes(self.shapes, lambda: canvas.store.move(self.rows, self.dx, self.dy))
+
+    def merge(self, other):
+        if (type(other) is not MoveShapes or other.gesture is None or other.gesture != self.gesture
+                or not np.array_equal(other.rows, self.rows)):
+            return False
+        self.dx += other.dx
+        self.dy += other.dy
+        return True
+
+    def nbytes(self):
+        return 64 + self.rows.nbytes + SHAPE_REF_BYTES * len(self.shapes)
+
+class ChangeGeometry(Command):
+    # Зміна розміру: старі і нові координати рядків сховища
+    def __init__(self, shapes, rows, old, new, gesture=None):
+        self.shapes = list(shapes)
+        self.rows = rows
+        self.old, self.new = old, new
+        self.gesture = gesture
+
+    def _apply(self, canvas, coords):
+        canvas.modify_shapes(self.shapes, lambda: canvas.store.set_coords(self.rows, coords))
+
+    def undo(self, canvas): self._apply(canvas, self.old)
+    def redo(self, canvas): self._apply(canvas, self.new)
+
+    def merge(self, other):
+        if (type(other) is not ChangeGeometry or other.gesture is None or other.gesture != self.gesture
+                or not np.array_equal(other.rows, self.rows)):
+            return False
+        self.new = other.new
+        return True
+
+    def nbytes(self):
+        return 64 + self.rows.nbytes + self.old.nbytes + self.new.nbytes + SHAPE_REF_BYTES * len(self.shapes)
+
+class ChangeStyle(Command):
+    # Стиль - це id у таблиці стилів плюс прапорець заливки
+    def __init__(self, shapes, rows, old_styles, old_fill, new_styles, new_fill):
+        self.shapes = list(shapes)
+        self.rows = rows
+        self.old = (old_styles, old_fill)
+        self.new = (new_styles, new_fill)
+
+    def _apply(self, canvas, state):
+        style_ids, fill = state
+        def apply():
+            store = canvas.store
+            store.style[self.rows] = style_ids
+            store.flags[self.rows] = (store.flags[self.rows] & ~np.uint8(FILL)) | fill
+        canvas.modify_shapes(self.shapes, apply)
+
+    def undo(self, canvas): self._apply(canvas, self.old)
+    def redo(self, canvas): self._apply(canvas, self.new)
+
+    def nbytes(self):
+        arrays = self.rows.nbytes + sum(a.nbytes for a in self.old + self.new)
+        return 64 + arrays + SHAPE_REF_BYTES * len(self.shapes)
+
+class EditText(Command):
+    def __init__(self, shape, old, new):
+        self.shape = shape
+        self.old, self.new = old, new
+
+    def _apply(self, canvas, text):
+        def apply(): self.shape.text = text
+        canvas.modify_shapes([self.shape], apply)
+
+    def undo(self, canvas): self._apply(canvas, self.old)
+    def redo(self, canvas): self._apply(canvas, self.new)
+
+    def nbytes(self):
+        return 64 + 2 * (len(self.old) + len(self.new))
+
+class History:
+    """Стек скасування/повтору з обмеженням пам'яті: найстаріші записи витісняються"""
+
+    def __init__(self, max_bytes=64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.undo_stack = []
+        self.redo_stack = []
+        self.used = 0 # байтів у стеку скасування
+        self.journal = None # спостерігач змін (автозбереження): record / record_undo / reset
+
+    def push(self, command):
+        # Команда описує вже виконану зміну
+        if self.journal: self.journal.record(command)
+        self.redo_stack.clear()
+        if self.undo_stack:
+            last = self.undo_stack[-1]
+            before = last.nbytes()
+            if last.merge(command):
+                self.used += last.nbytes() - before
+                return
+        self.undo_stack.append(command)
+        self.used += command.nbytes()
+        self._evict()
+
+    def _evict(self):
+        # Останню команду не витісняємо навіть якщо вона більша за бюджет
+        dropped = 0
+        while self.used > self.max_bytes and len(self.undo_stack) - dropped > 1:
+            self.used -= self.undo_stack[dropped].nbytes()
+            dropped += 1
+        if dropped: del self.undo_stack[:dropped]
+
+    def undo(self, canvas):
+        if not self.undo_stack: return False
+        command = self.undo_stack.pop()
+        self.used -= command.nbytes()
+        command.undo(canvas)
+        if self.journal: self.journal.record_undo(command)
+        self.redo_stack.append(command)
+        return True
+
+    def redo(self, canvas):
+        if not self.redo_stack: return False
+        command = self.redo_stack.pop()
+        command.redo(canvas)
+        if self.journal: self.journal.record(command)
+        self.undo_stack.append(command)
+        self.used += command.nbytes()
+        self._evict()
+        return True
+
+    def can_undo(self): return bool(self.undo_stack)
+    def can_redo(self): return bool(self.redo_stack)
+
+    def clear(self):
+        # Сцену замінено цілком - журналу потрібен новий знімок
+        if self.journal: self.journal.reset()
+        self.undo_stack.clear()
+        self.redo_stack.clear()
+        self.used = 0
@@ -1,14 +1,17 @@
-from PyQt5.QtWidgets import QMainWindow, QAction, QStatusBar, QMessageBox, QInputDialog
-from PyQt5.QtCore import Qt
+from PyQt5.QtWidgets import QMainWindow, QAction, QStatusBar, QMessageBox, QInputDialog, QProgressBar, QToolButton
+from PyQt5.QtCore import Qt, QTimer, QCoreApplication
 from viewer import Viewer
 from toolbar import Toolbar
-from files import FileManager
+from files import FileManager, BackgroundSaver
+from autosave import Autosave, replay
 from shapes import TextShape
+from styles import styles
 
 class MainWindow(QMainWindow):
     def __init__(self):
         super().__init__()
         self.filename = None
+        self.frame_stats = False # показ статистики кадрів у рядку стану
         self.init_ui()
         
     def init_ui(self):
@@ -27,12 +30,21 @@ class MainWindow(QMainWindow):
         self.add_action(file_menu, "Вихід", self.close)
         
         edit_menu = menubar.addMenu("Редагування")
+        self.add_action(edit_menu, "Скасувати", self.undo, "Ctrl+Z")
+        self.add_action(edit_menu, "Повторити", self.redo, "Ctrl+Y")
+        edit_menu.addSeparator()
         self.add_action(edit_menu, "Очистити сцену", self.clear_scene)
         self.add_action(edit_menu, "Видалити об'єкт", self.delete_obj, "Delete")
         self.add_action(edit_menu, "Редагувати текст", self.edit_text, "F2")
         
         view_menu = menubar.addMenu("Вид")
         self.add_action(view_menu, "Сітка вкл/викл", self.toggle_grid, "Ctrl+G")
+        view_menu.addSeparator()
+        self.add_action(view_menu, "Збільшити", self.zoom_in, "Ctrl+=")
+        self.add_action(view_menu, "Зменшити", self.zoom_out, "Ctrl+-")
+        self.add_action(view_menu, "Масштаб 100%", self.reset_zoom, "Ctrl+0")
+        view_menu.addSeparator()
+        self.add_action(view_menu, "Статистика кадрів", self.toggle_frame_stats, "Ctrl+Shift+F")
         
         help_menu = menubar.addMenu("Довідка")
         self.add_action(help_menu, "Про програму", self.about)
@@ -48,6 +60,29 @@ class MainWindow(QMainWindow):
         self.statusbar = QStatusBar()
         self.setStatusBar(self.statusbar)
         self.statusbar.showMessage("Готово. Оберіть інструмент для малювання.")
+        
+        # Збереження у фоні з прогресом у рядку стану
+        self.save_progress = QProgressBar()
+        self.save_progress.setMaximumWidth(160)
+        self.save_progress.setMaximumHeight(16)
+        self.save_progress.hide()
+        self.statusbar.addPermanentWidget(self.save_progress)
+        self.save_cancel = QToolButton()
+        self.save_cancel.setText("Скасувати")
+        self.save_cancel.setToolTip("Скасувати збереження")
+        self.save_cancel.hide()
+        self.statusbar.addPermanentWidget(self.save_cancel)
+        self.saver = BackgroundSaver(self)
+        self.saver.progress.connect(self.on_save_progress)
+        self.saver.saved.connect(self.on_saved)
+        self.saver.failed.connect(self.on_save_failed)
+        self.saver.cancelled.connect(self.on_save_cancelled)
+        self.save_cancel.clicked.connect(self.saver.cancel)
+        self.save_token = None # позиція журналу автозбереження на момент знімка
+        
+        # Автозбереження журналом; відновлення пропонуємо, коли вікно вже показане
+        self.autosave = Autosave(self.viewer.canvas, self)
+        QTimer.singleShot(0, self.check_recovery)
 
     def add_action(self, menu, name, func, shortcut=None):
         act = QAction(name, self)
@@ -81,6 +116,14 @@ class MainWindow(QMainWindow):
             self.viewer.canvas.delete_selected()
             self.statusbar.showMessage("Об'єкти видалено")
         
+    def undo(self):
+        if not self.viewer.canvas.undo():
+            self.statusbar.showMessage("Немає дій для скасування")
+            
+    def redo(self):
+        if not self.viewer.canvas.redo():
+            self.statusbar.showMessage("Немає дій для повтору")
+        
     def toggle_grid(self):
         c = self.viewer.canvas
         c.grid_enabled = not c.grid_enabled
@@ -88,6 +131,38 @@ class MainWindow(QMainWindow):
         state = "увімкнено" if c.grid_enabled else "вимкнено"
         self.statusbar.showMessage(f"Сітку {state}")
         
+    def zoom_in(self):
+        self.viewer.zoom_in()
+        self.show_zoom()
+        
+    def zoom_out(self):
+        self.viewer.zoom_out()
+        self.show_zoom()
+        
+    def reset_zoom(self):
+        self.viewer.reset_zoom()
+        self.show_zoom()
+        
+    def toggle_frame_stats(self):
+        frames = self.viewer.canvas.frames
+        self.frame_stats = not self.frame_stats
+        if self.frame_stats:
+            frames.statsChanged.connect(self.show_frame_stats)
+            self.statusbar.showMessage("Статистика кадрів: рухайте мишею над полотном")
+        else:
+            frames.statsChanged.disconnect(self.show_frame_stats)
+            self.statusbar.showMessage("Статистику кадрів вимкнено")
+            
+    def show_frame_stats(self, st):
+        self.statusbar.showMessage(
+            f"Кадрів: {st['frames']}, подій: {st['events']}, відкинуто: {st['dropped']} | "
+            f"затримка {st['latency']:.1f} мс (макс {st['max_latency']:.1f}) | "
+            f"обробка {st['handler']:.1f} мс (макс {st['max_handler']:.1f}) | "
+            f"малювання {st['paint']:.1f} мс (макс {st['max_paint']:.1f})")
+        
+    def show_zoom(self):
+        self.statusbar.showMessage(f"Масштаб: {round(self.viewer.canvas.zoom * 100)}%")
+        
     def edit_text(self):
         found = False
         for s in self.viewer.canvas.selected_shapes:
@@ -101,33 +176,116 @@ class MainWindow(QMainWindow):
     def new_file(self):
         if QMessageBox.question(self, "Новий файл", "Створити новий файл? Незбережені дані будуть втрачені.") == QMessageBox.Yes:
             self.viewer.canvas.clear_scene()
+            self.viewer.canvas.history.clear()
             self.filename = None
+            self.reclaim_styles()
+            self.autosave.start(None)
             self.setWindowTitle("Векторний графічний редактор")
             self.statusbar.showMessage("Створено новий файл")
 
+    def check_recovery(self):
+        # Журнал попереднього сеансу, що завершився аварійно
+        path = Autosave.pending()
+        if path:
+            try:
+                result = replay(path)
+            except Exception as e:
+                # Будь-яка помилка розбору (пошкоджений чи чужий файл) не повинна зупиняти запуск
+                result = None
+                bad = Autosave.set_aside(path)
+                where = f"Його збережено як {bad}." if bad else "Його не вдалося перейменувати."
+                self.statusbar.showMessage(f"Журнал автозбереження пошкоджено: {e}")
+                QMessageBox.warning(self, "Відновлення",
+                                    f"Не вдалося прочитати журнал автозбереження ({e}). {where}")
+            if result and not result.clean and QMessageBox.question(
+                    self, "Відновлення",
+                    f"Знайдено незбережені зміни попереднього сеансу ({len(result.shapes)} об'єктів). Відновити?"
+                    ) == QMessageBox.Yes:
+                self.viewer.canvas.set_shapes(result.shapes)
+                self.reclaim_styles()
+                self.filename = result.document
+                title = f" - {result.document}" if result.document else ""
+                self.setWindowTitle(f"Векторний графічний редактор{title} (відновлено)")
+                self.statusbar.showMessage(f"Відновлено {len(result.shapes)} об'єктів з журналу "
+                                           f"({result.operations} операцій)")
+                self.autosave.start(result.document, clean=False)
+                return
+            Autosave.discard(path)
+        self.autosave.start(self.filename)
+
+    def reclaim_styles(self):
+        # Документ замінено: звільняємо стилі, яких не має жодна фігура. Історію вже очищено,
+        # а новий журнал автозбереження (start) визначить стилі наново. Плитки і запис у фоні
+        # читають таблицю стилів - плиток дочікуємось, а під час запису звільнення відкладаємо
+        if self.saver.busy(): return
+        canvas = self.viewer.canvas
+        canvas.tiles.wait()
+        styles.reclaim(canvas.store.used_styles().tolist())
+
     def open_file(self):
         shapes, fname = FileManager.load(self)
         if shapes is not None:
             self.viewer.canvas.set_shapes(shapes)
+            self.reclaim_styles()
             self.filename = fname
+            self.autosave.start(fname)
             self.setWindowTitle(f"Векторний графічний редактор - {fname}")
             self.statusbar.showMessage(f"Завантажено файл: {fname}")
 
     def save_file(self):
-        shapes = self.viewer.canvas.get_shapes()
-        ok, fname = FileManager.save(shapes, self.filename, self)
-        if ok:
-            self.filename = fname
-            self.setWindowTitle(f"Векторний графічний редактор - {fname}")
-            self.statusbar.showMessage("Файл збережено успішно")
+        fname = self.filename or FileManager.ask_save_filename(self)
+        if fname: self.start_save(fname)
             
     def save_as(self):
-        shapes = self.viewer.canvas.get_shapes()
-        ok, fname = FileManager.save(shapes, None, self)
-        if ok:
-            self.filename = fname
-            self.setWindowTitle(f"Векторний графічний редактор - {fname}")
-            self.statusbar.showMessage("Файл збережено успішно")
+        fname = FileManager.ask_save_filename(self)
+        if fname: self.start_save(fname)
+
+    def start_save(self, fname):
+        # Знімок сцени береться зараз, запис іде у фоні - редагувати можна одразу.
+        # Ім'я документа змінюється лише після вдалого запису (on_saved)
+        self.save_token = self.autosave.save_token()
+        self.saver.save(self.viewer.canvas.get_shapes(), fname)
+        self.save_progress.setValue(0)
+        self.save_progress.show()
+        self.save_cancel.show()
+        self.statusbar.showMessage(f"Збереження {fname}...")
+
+    def on_save_progress(self, done, total):
+        self.save_progress.setMaximum(max(total, 1))
+        self.save_progress.setValue(done)
+
+    def on_saved(self, fname):
+        self.filename = fname
+        if not self.saver.busy():
+            self.hide_save_progress()
+            self.autosave.mark_saved(fname, self.save_token)
+        self.setWindowTitle(f"Векторний графічний редактор - {fname}")
+        self.statusbar.showMessage("Файл збережено успішно")
+
+    def on_save_failed(self, fname, message):
+        if not self.saver.busy(): self.hide_save_progress()
+        self.statusbar.showMessage("Помилка збереження")
+        QMessageBox.critical(self, "Помилка", f"{fname}: {message}")
+
+    def on_save_cancelled(self, fname):
+        # Файл на диску і ім'я документа лишаються попередніми
+        if not self.saver.busy(): self.hide_save_progress()
+        self.statusbar.showMessage(f"Збереження {fname} скасовано")
+
+    def hide_save_progress(self):
+        self.save_progress.hide()
+        self.save_cancel.hide()
+
+    def closeEvent(self, event):
+        # Незавершений запис доводимо до кінця, інакше файл залишиться старим
+        if self.saver.busy():
+            self.statusbar.showMessage("Завершення збереження...")
+            self.saver.wait()
+            # Результат запису приходить сигналом через чергу - обробляємо його зараз,
+            # щоб помилку було показано, а журнал знав, чи збереження вдалося
+            QCoreApplication.sendPostedEvents()
+        self.autosave.close()
+        super().closeEvent(event)
 
     def about(self):
         # Oпис програми
@@ -142,6 +300,7 @@ class MainWindow(QMainWindow):
             <li>Налаштування стилів: колір контуру та заливки, товщина та тип ліній.</li>
             <li>Маніпуляції з об'єктами: виділення, переміщення, масштабування.</li>
             <li>Збереження та завантаження проектів у форматі JSON.</li>
+            <li>Автозбереження журналом змін і відновлення після аварійного завершення.</li>
         </ul>
         
         <p><b>Керування:</b></p>
@@ -151,6 +310,8 @@ class MainWindow(QMainWindow):
             <li><b>ПКМ (на тексті)</b> - Швидке редагування тексту</li>
             <li><b>F2</b> - Редагування тексту</li>
             <li><b>Delete</b> - Видалення виділеного</li>
+            <li><b>Ctrl+Z / Ctrl+Y</b> - Скасувати / повторити</li>
+            <li><b>Ctrl + коліщатко</b> - Масштаб, <b>СКМ</b> - Панорамування</li>
         </ul>
         """
         QMessageBox.about(self, "Про програму", text)
\ No newline at end of file
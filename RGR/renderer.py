@@ -0,0 +1,130 @@
+import math
+from PyQt5.QtCore import Qt, QRect, QRectF
+from PyQt5.QtGui import QPainter, QColor, QImage, QTransform
+from shapes import TextShape, HANDLE_PEN, HANDLE_BRUSH
+
+class Renderer:
+    """Малювання фігур з рівнями деталізації (LOD) залежно від масштабу.
+    Сусідні фігури одного типу і стилю малюються однією групою"""
+
+    TIERS = ('full', 'simple', 'placeholder', 'dot')
+
+    def __init__(self, dot_size=1.0, simple_size=4.0, text_size=6.0, static_text=True):
+        # Пороги в пікселях на екрані
+        self.dot_size = dot_size       # менше - точка щільності
+        self.simple_size = simple_size # менше - простий залитий прямокутник
+        self.text_size = text_size     # менший шрифт - смужка замість тексту
+        self.static_text = static_text # False - текст без кешованого QStaticText (фонові потоки)
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.stats = dict.fromkeys(self.TIERS, 0)
+        self.stats['batches'] = 0
+
+    def draw(self, painter, shapes):
+        # Малюємо тільки тіла фігур; ручки - окремо через draw_handles().
+        # Масштаб беремо з поточного перетворення художника
+        t = painter.worldTransform()
+        scale = math.sqrt(abs(t.determinant())) or 1.0
+        stats = self.stats
+        dots = {} # піксель екрана -> [кількість, колір]
+        # Поточна група: фігури, їх рамки і ключ (тип, стиль, заливка)
+        run, rects, run_key = [], [], None
+        simple_size, dot_size = self.simple_size, self.dot_size
+
+        for s in shapes:
+            r = s.get_bounding_rect()
+            size = max(r.width(), r.height()) * scale
+
+            # Виділені фігури завжди повністю
+            if s.selected or size >= simple_size:
+                cls = type(s)
+                if cls is TextShape and not s.selected and s.font_size * scale < self.text_size:
+                    self.flush(painter, run, rects, run_key)
+                    run, rects, run_key = [], [], None
+                    self.draw_placeholder(painter, s, r)
+                    stats['placeholder'] += 1
+                    continue
+                key = (cls, s.style, s.fill_enabled)
+                if key != run_key:
+                    self.flush(painter, run, rects, run_key)
+                    run, rects, run_key = [], [], key
+                run.append(s)
+                rects.append(r)
+                stats['full'] += 1
+            elif size >= dot_size:
+                self.flush(painter, run, rects, run_key)
+                run, rects, run_key = [], [], None
+                painter.fillRect(r, self.solid_color(s))
+                stats['simple'] += 1
+            else:
+                # Субпіксельні фігури зливаються в одну точку на піксель
+                p = t.map(r.center())
+                dot = dots.setdefault((p.x(), p.y()), [0, None])
+                dot[0] += 1
+                dot[1] = self.solid_color(s)
+                stats['dot'] += 1
+
+        self.flush(painter, run, rects, run_key)
+        if dots: self.draw_dots(painter, dots)
+
+    def flush(self, painter, run, rects, key):
+        # Одна зміна пера/пензля на всю групу, порядок z зберігається
+        if not run: return
+        if key[0] is TextShape and not self.static_text:
+            for s in run: s.paint(painter, static=False)
+        else:
+            key[0].paint_batch(painter, run, rects)
+        self.stats['batches'] += 1
+
+    def draw_handles(self, painter, shapes):
+        # Ручки всіх виділених фігур - одним викликом drawRects
+        rects = []
+        for s in shapes:
+            if s.selected and not s.is_being_drawn:
+                rects.extend(s.get_handle_rects())
+        if not rects: return
+        painter.setPen(HANDLE_PEN)
+        painter.setBrush(HANDLE_BRUSH)
+        painter.drawRects(rects)
+
+    def solid_color(self, shape):
+        return shape.fill_color if shape.fill_color.alpha() > 0 else shape.color
+
+    def draw_placeholder(self, painter, shape, rect):
+        # Нечитабельний текст - напівпрозора смужка по центру рамки
+        h = min(rect.height(), shape.font_size)
+        bar = QRect(rect.left() + rect.width() // 10, rect.center().y() - h // 2,
+                    rect.width() * 8 // 10, h)
+        if shape.fill_color.alpha() > 0:
+            painter.fillRect(rect, shape.fill_color)
+        color = QColor(shape.color)
+        color.setAlpha(120)
+        painter.fillRect(bar, color)
+
+    def draw_dots(self, painter, dots):
+        # Точки малюємо в координатах пристрою: що більше фігур, то щільніша точка
+        painter.save()
+        painter.setWorldTransform(QTransform())
+        for (x, y), (count, color) in dots.items():
+            c = QColor(color)
+            c.setAlpha(min(255, 80 + 40 * count))
+            painter.setPen(c)
+            painter.drawPoint(x, y)
+        painter.restore()
+
+    def render_image(self, shapes, world_rect, width, height, background=None):
+        # Мініатюра або огляд: вміщуємо world_rect у зображення заданого розміру
+        self.reset_stats()
+        image = QImage(width, height, QImage.Format_ARGB32_Premultiplied)
+        image.fill(background if background is not None else Qt.transparent)
+        if world_rect.isEmpty(): return image
+        scale = min(width / world_rect.width(), height / world_rect.height())
+        painter = QPainter(image)
+        painter.translate((width - world_rect.width() * scale) / 2, (height - world_rect.height() * scale) / 2)
+        painter.scale(scale, scale)
+        painter.translate(-world_rect.x(), -world_rect.y())
+        painter.setClipRect(QRectF(world_rect))
+        self.draw(painter, shapes)
+        painter.end()
+        return image
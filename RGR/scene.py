@@ -0,0 +1,128 @@
+from bisect import bisect_left, insort
+
+class Scene:
+    """Впорядкований за z набір фігур зі сталими id.
+    Порядок малювання - відсортований список ключів (z, id): нова фігура нагорі
+    додається в кінець, вставка посередині (наприклад, відновлення видаленої фігури)
+    знаходить місце двійковим пошуком. Перевірка належності - O(1) за словником"""
+
+    BULK = 64 # від стількох фігур за раз список перебудовується цілком, а не по одній
+
+    def __init__(self):
+        self._z = {}     # фігура -> ключ z
+        self._by_id = {} # id -> фігура
+        self._id = {}    # фігура -> id
+        self._order = [] # відсортовані (z, id) - порядок малювання
+        self.next_id = 1
+        self.top_z = 0.0
+
+    def add(self, shape, id_=None, z=None):
+        id_ = self._add(shape, id_, z)
+        insort(self._order, (self._z[shape], id_))
+        return id_
+
+    def _add(self, shape, id_, z):
+        if id_ is None:
+            id_ = self.next_id
+        self.next_id = max(self.next_id, id_ + 1)
+        if z is None or z > self.top_z:
+            z = self.top_z + 1 if z is None else z
+            self.top_z = z
+        self._z[shape] = z
+        self._by_id[id_] = shape
+        self._id[shape] = id_
+        return id_
+
+    def add_many(self, shapes, ids, zs):
+        # Багато вставок посередині: дописати й пересортувати (майже впорядкований список - O(n))
+        if len(shapes) < self.BULK:
+            for s, id_, z in zip(shapes, ids, zs): self.add(s, id_, z)
+            return
+        for s, id_, z in zip(shapes, ids, zs):
+            id_ = self._add(s, id_, z)
+            self._order.append((self._z[s], id_))
+        self._order.sort()
+
+    def extend(self, shapes):
+        # Нові фігури завжди лягають нагору - ключі зростають, тож просто дописуються
+        add, append, z = self._add, self._order.append, self._z
+        for s in shapes:
+            id_ = add(s, None, None)
+            append((z[s], id_))
+
+    def remove(self, shape):
+        if shape not in self._z: return False
+        key = self._forget(shape)
+        del self._order[bisect_left(self._order, key)]
+        return True
+
+    def _forget(self, shape):
+        id_ = self._id.pop(shape)
+        del self._by_id[id_]
+        return (self._z.pop(shape), id_)
+
+    def remove_many(self, shapes):
+        removed = [s for s in shapes if s in self._z]
+        if len(removed) < self.BULK:
+            for s in removed: self.remove(s)
+            return removed
+        gone = {self._forget(s) for s in removed}
+        self._order = [key for key in self._order if key not in gone]
+        return removed
+
+    def clear(self):
+        self._z.clear()
+        self._by_id.clear()
+        self._id.clear()
+        self._order = []
+        self.top_z = 0.0
+
+    def z_of(self, shape):
+        return self._z[shape]
+
+    def sort(self, shapes):
+        # Список фігур сцени на місці впорядковується за z (ключ - метод словника, без виклику Python)
+        shapes.sort(key=self._z.__getitem__)
+        return shapes
+
+    def id_of(self, shape):
+        return self._id.get(shape)
+
+    def __iter__(self):
+        by_id = self._by_id
+        return iter([by_id[id_] for _, id_ in self._order])
+
+    def __len__(self):
+        return len(self._z)
+
+    def __contains__(self, shape):
+        return shape in self._z
+
+class Selection:
+    """Виділені фігури: множина з O(1) перевіркою і видаленням.
+    Порядок малювання береться з z сцени"""
+
+    def __init__(self, scene):
+        self.scene = scene
+        self._items = {} # впорядкована множина
+
+    def add(self, shape):
+        self._items[shape] = None
+
+    def discard(self, shape):
+        self._items.pop(shape, None)
+
+    def clear(self):
+        self._items.clear()
+
+    def ordered(self):
+        return self.scene.sort(list(self._items))
+
+    def __iter__(self):
+        return iter(list(self._items))
+
+    def __len__(self):
+        return len(self._items)
+
+    def __contains__(self, shape):
+        return shape in self._items
@@ -0,0 +1,81 @@
+import time
+from PyQt5.QtCore import Qt, QObject, QTimer, pyqtSignal
+from PyQt5.QtGui import QGuiApplication
+
+class FrameScheduler(QObject):
+    """Збирає події руху миші і передає обробнику лише останню - не частіше
+    ніж раз на кадр дисплея. Повільний кадр не збирає чергу: поки він триває,
+    нові події замінюють одна одну"""
+
+    statsChanged = pyqtSignal(dict) # раз на секунду активності
+
+    def __init__(self, handler, parent=None):
+        super().__init__(parent)
+        self.handler = handler
+        screen = QGuiApplication.primaryScreen()
+        rate = screen.refreshRate() if screen else 0
+        self.interval = 1000 / (rate if rate > 0 else 60) # мс на кадр
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.setTimerType(Qt.PreciseTimer)
+        self.timer.timeout.connect(self.flush)
+        self.pending = None # аргументи останньої необробленої події
+        self.pending_since = 0.0 # коли надійшла найстаріша з них
+        self.last_frame = 0.0
+        self.window_start = time.perf_counter()
+        self.last_stats = None
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.stats = {'events': 0, 'frames': 0, 'dropped': 0, 'paints': 0,
+                      'latency': 0.0, 'max_latency': 0.0, # мс від події до обробки
+                      'handler': 0.0, 'max_handler': 0.0, # мс оновлення моделі
+                      'paint': 0.0, 'max_paint': 0.0}     # мс paintEvent
+
+    def post(self, *args):
+        now = time.perf_counter()
+        self.stats['events'] += 1
+        if self.pending is None:
+            self.pending_since = now
+        else:
+            self.stats['dropped'] += 1
+        self.pending = args
+        if not self.timer.isActive():
+            # Наступна обробка - не раніше ніж через кадр після попередньої
+            delay = self.last_frame + self.interval / 1000 - now
+            self.timer.start(max(0, round(delay * 1000)))
+
+    def flush(self):
+        # Також викликається перед натисканням/відпусканням, щоб не змінити порядок подій
+        if self.pending is None: return
+        self.timer.stop()
+        args, self.pending = self.pending, None
+        start = time.perf_counter()
+        self.handler(*args)
+        end = time.perf_counter()
+        self.last_frame = start
+        st = self.stats
+        st['frames'] += 1
+        latency = (start - self.pending_since) * 1000
+        st['latency'] += latency
+        st['max_latency'] = max(st['max_latency'], latency)
+        st['handler'] += (end - start) * 1000
+        st['max_handler'] = max(st['max_handler'], (end - start) * 1000)
+        self.report(end)
+
+    def note_paint(self, ms):
+        st = self.stats
+        st['paints'] += 1
+        st['paint'] += ms
+        st['max_paint'] = max(st['max_paint'], ms)
+
+    def report(self, now):
+        if now - self.window_start < 1.0: return
+        st = dict(self.stats)
+        frames = max(1, st['frames'])
+        for key in ('latency', 'handler'): st[key] /= frames
+        st['paint'] /= max(1, st['paints'])
+        self.last_stats = st
+        self.window_start = now
+        self.reset_stats()
+        self.statsChanged.emit(st)
@@ -1,33 +1,178 @@
 from abc import ABC, abstractmethod
-from PyQt5.QtCore import QRect, QPoint, Qt
-from PyQt5.QtGui import QPainter, QPen, QBrush, QColor, QFont, QPolygon
+from operator import attrgetter
+from PyQt5.QtCore import QRect, QRectF, QPoint, QPointF, QLine, Qt
+from PyQt5.QtGui import QPen, QBrush, QColor, QPolygon, QStaticText, QTextOption
 import math
+import numpy as np
+from styles import styles
+from store import default_store, KIND_CODES, TRIANGLE, ALIVE, SELECTED, FILL, X1, Y1, X2, Y2, AX, AY, BX, BY, CX, CY
+
+# Спільні перо і пензель для ручок зміни розміру; рамка - 1 px за будь-якого масштабу
+HANDLE_PEN = QPen(QColor(0, 120, 215), 1)
+HANDLE_PEN.setCosmetic(True)
+HANDLE_BRUSH = QBrush(Qt.white)
+
+# Які координати міняє кожна з 8 ручок: (колонка, 0 - x / 1 - y)
+HANDLE_COLUMNS = {
+    0: ((X1, 0), (Y1, 1)), 1: ((Y1, 1),), 2: ((Y1, 1), (X2, 0)), 3: ((X1, 0),),
+    4: ((X2, 0),), 5: ((X1, 0), (Y2, 1)), 6: ((Y2, 1),), 7: ((X2, 0), (Y2, 1))
+}
+
+# Реєстр типів фігур: назва у файлі -> клас і код типу у сховищі -> клас
+SHAPE_TYPES = {}
+SHAPE_CLASSES = {}
+TEXT = KIND_CODES['text']
+SOLID_LINE = int(Qt.SolidLine)
+
+def shape_type(name):
+    # Декоратор класу фігури: реєструє його для читання документів
+    def register(cls):
+        cls.kind = KIND_CODES[name]
+        SHAPE_TYPES[name] = cls
+        SHAPE_CLASSES[cls.kind] = cls
+        return cls
+    return register
 
 class Shape(ABC):
-    """Базовий клас для фігур"""
-    
-    def __init__(self, start_point, end_point):
-        self.start = QPoint(start_point)
-        self.end = QPoint(end_point)
-        # Налаштування стилю
-        self.color = QColor(0, 0, 0)
-        self.line_width = 2
-        self.line_style = Qt.SolidLine
-        self.fill_color = QColor(255, 255, 255, 0) # Прозорий
-        self.fill_enabled = False
+    """Базовий клас для фігур.
+    Дані фігури живуть у рядку ShapeStore, сам об'єкт - лише представлення"""
+    
+    __slots__ = ('_store', '_row', 'is_being_drawn', '_handles', '_geometry')
+    
+    # Розмір ручок у світових координатах, дробовий (полотно ставить 8 px / масштаб)
+    handle_size = 8
+    
+    def __init__(self, start_point, end_point, store=None):
+        self._store = store if store is not None else default_store
+        self._row = self._store.allocate(KIND_CODES[self.get_type()])
+        self._handles = None # ((версія геометрії, розмір ручок), список QRect)
+        self._geometry = None # (версія геометрії, результат build_geometry)
+        self.start = start_point
+        self.end = end_point
+        # Налаштування стилю: один спільний об'єкт з таблиці стилів
+        self.style = styles.intern(QColor(0, 0, 0), QColor(255, 255, 255, 0), 2, Qt.SolidLine)
         
         # Стан фігури
-        self.selected = False
         self.is_being_drawn = False
+    
+    def __del__(self):
+        # Рядок сховища звільняється разом з представленням
+        try: self._store.release(self._row)
+        except (AttributeError, TypeError): pass
+    
+    @classmethod
+    def view(cls, store, row):
+        # Представлення вже заповненого рядка сховища (масове завантаження) - без __init__
+        obj = cls.__new__(cls)
+        obj._store, obj._row = store, row
+        obj._handles = obj._geometry = None
+        obj.is_being_drawn = False
+        return obj
+    
+    @property
+    def store(self): return self._store
+    @property
+    def row(self): return self._row
+    
+    # Геометрія і прапорці читаються прямо зі сховища
+    @property
+    def start(self):
+        x, y = self._store.coords[self._row, X1:Y1 + 1].tolist()
+        return QPoint(x, y)
+    @start.setter
+    def start(self, p): self._set_coords(X1, (p.x(), p.y()))
+    
+    @property
+    def end(self):
+        x, y = self._store.coords[self._row, X2:Y2 + 1].tolist()
+        return QPoint(x, y)
+    @end.setter
+    def end(self, p): self._set_coords(X2, (p.x(), p.y()))
+    
+    @property
+    def geometry_version(self):
+        # Зростає при кожній зміні координат (move, resize, calculate_third_point...)
+        return int(self._store.version[self._row])
+    
+    def geometry(self):
+        # Похідна геометрія (полігони, рамки) рахується раз на версію
+        version = self.geometry_version
+        if self._geometry is None or self._geometry[0] != version:
+            self._geometry = (version, self.build_geometry())
+        return self._geometry[1]
+    
+    def build_geometry(self):
+        return None
+    
+    def _set_coords(self, col, values):
+        # Запис кількох колонок підряд, починаючи з col, і нова версія геометрії
+        self._store.coords[self._row, col:col + len(values)] = values
+        self._store.version[self._row] += 1
+    
+    @property
+    def selected(self): return bool(self._store.flags[self._row] & SELECTED)
+    @selected.setter
+    def selected(self, on): self._store.set_flag(self._row, SELECTED, on)
+    
+    @property
+    def fill_enabled(self): return bool(self._store.flags[self._row] & FILL)
+    @fill_enabled.setter
+    def fill_enabled(self, on): self._store.set_flag(self._row, FILL, on)
+    
+    @property
+    def style(self): return styles.by_id[self._store.style[self._row]]
+    @style.setter
+    def style(self, style): self._store.style[self._row] = style.id
         
-    @abstractmethod
     def draw(self, painter):
+        self.paint(painter)
+        if self.selected and not self.is_being_drawn:
+            self.draw_handles(painter)
+    
+    @abstractmethod
+    def paint(self, painter):
+        # Сама фігура, без ручок
         pass
     
+    @classmethod
+    def paint_batch(cls, painter, shapes, rects):
+        # Група фігур одного типу і стилю (rects - їх рамки); за замовчуванням по одній
+        for s in shapes: s.paint(painter)
+    
+    def get_handle_rects(self):
+        # Ручки, які видно на екрані
+        return self.get_resize_handles()
+    
+    def draw_handles(self, painter):
+        painter.setPen(HANDLE_PEN)
+        painter.setBrush(HANDLE_BRUSH)
+        painter.drawRects(self.get_handle_rects())
+    
     @abstractmethod
     def get_type(self):
         pass
     
+    # Параметри стилю читаються зі спільного Style, а зміна бере інший інтернований
+    @property
+    def color(self): return self.style.color
+    @color.setter
+    def color(self, c): self.style = styles.derive(self.style, color=c)
+    
+    @property
+    def fill_color(self): return self.style.fill_color
+    @fill_color.setter
+    def fill_color(self, c): self.style = styles.derive(self.style, fill_color=c)
+    
+    @property
+    def line_width(self): return self.style.line_width
+    @line_width.setter
+    def line_width(self, w): self.style = styles.derive(self.style, line_width=w)
+    
+    @property
+    def line_style(self): return self.style.line_style
+    @line_style.setter
+    def line_style(self, s): self.style = styles.derive(self.style, line_style=s)
+    
     def set_color(self, color):
         self.color = color
     
@@ -42,54 +187,59 @@ class Shape(ABC):
         self.line_style = style
     
     def get_bounding_rect(self):
-        return QRect(self.start, self.end).normalized()
+        x1, y1, x2, y2 = self._store.coords[self._row, X1:Y2 + 1].tolist()
+        return QRect(QPoint(min(x1, x2), min(y1, y2)), QPoint(max(x1, x2), max(y1, y2)))
+    
+    def get_paint_rect(self):
+        # Область, яку фігура може зафарбувати: рамка + товщина пера + ручки
+        m = self.line_width + 5
+        return self.get_bounding_rect().adjusted(-m, -m, m, m)
     
     def contains(self, point):
-        rect = self.get_bounding_rect()
-        return rect.adjusted(-5, -5, 5, 5).contains(point)
+        # Точна перевірка за формою фігури (відрізок, еліпс, трикутник) з допуском 5 px
+        return bool(self._store.hit_test([self._row], point.x(), point.y(), styles.line_widths())[0])
     
     def is_in_selection_rect(self, selection_rect):
         return selection_rect.intersects(self.get_bounding_rect())
     
     def move(self, dx, dy):
-        self.start.setX(self.start.x() + dx)
-        self.start.setY(self.start.y() + dy)
-        self.end.setX(self.end.x() + dx)
-        self.end.setY(self.end.y() + dy)
+        # Зсуваємо всі точки рядка (вершини трикутника теж)
+        self._store.move(self._row, dx, dy)
     
     # Логіка зміни розміру
     def resize(self, handle_index, new_point):
         if not self.selected: return
             
         # Логіка для 8 точок (кути і сторони)
-        if handle_index == 0:   self.start = new_point
-        elif handle_index == 1: self.start.setY(new_point.y())
-        elif handle_index == 2: 
-            self.start.setY(new_point.y())
-            self.end.setX(new_point.x())
-        elif handle_index == 3: self.start.setX(new_point.x())
-        elif handle_index == 4: self.end.setX(new_point.x())
-        elif handle_index == 5:
-            self.start.setX(new_point.x())
-            self.end.setY(new_point.y())
-        elif handle_index == 6: self.end.setY(new_point.y())
-        elif handle_index == 7: self.end = new_point
+        xy = (new_point.x(), new_point.y())
+        coords = self._store.coords
+        for col, axis in HANDLE_COLUMNS.get(handle_index, ()):
+            coords[self._row, col] = xy[axis]
+        self._store.touch(self._row)
     
     def get_resize_handles(self):
         if not self.selected: return []
-        
+        # Ручки перебудовуються лише після зміни геометрії чи масштабу
+        key = (self.geometry_version, self.handle_size)
+        if self._handles is None or self._handles[0] != key:
+            self._handles = (key, self.build_resize_handles())
+        return self._handles[1]
+    
+    def build_resize_handles(self):
         rect = self.get_bounding_rect()
-        d = 8
+        d = self.handle_size
+        
+        h = d / 2
         
         return [
-            QRect(rect.left(), rect.top(), d, d),
-            QRect(rect.center().x() - d//2, rect.top(), d, d),
-            QRect(rect.right() - d, rect.top(), d, d),
-            QRect(rect.left(), rect.center().y() - d//2, d, d),
-            QRect(rect.right() - d, rect.center().y() - d//2, d, d),
-            QRect(rect.left(), rect.bottom() - d, d, d),
-            QRect(rect.center().x() - d//2, rect.bottom() - d, d, d),
-            QRect(rect.right() - d, rect.bottom() - d, d, d)
+            QRectF(rect.left(), rect.top(), d, d),
+            QRectF(rect.center().x() - h, rect.top(), d, d),
+            QRectF(rect.right() - d, rect.top(), d, d),
+            QRectF(rect.left(), rect.center().y() - h, d, d),
+            QRectF(rect.right() - d, rect.center().y() - h, d, d),
+            QRectF(rect.left(), rect.bottom() - d, d, d),
+            QRectF(rect.center().x() - h, rect.bottom() - d, d, d),
+            QRectF(rect.right() - d, rect.bottom() - d, d, d)
         ]
     
     def get_resize_handle_at(self, point):
@@ -114,135 +264,206 @@ class Shape(ABC):
     
     @staticmethod
     def from_dict(data):
-        type_ = data['type']
-        p1 = QPoint(data['start']['x'], data['start']['y'])
-        p2 = QPoint(data['end']['x'], data['end']['y'])
+        shapes = Shape.from_records([data])
+        return shapes[0] if shapes else None
+    
+    @staticmethod
+    def from_records(records, store=None):
+        # Масове створення фігур зі словників формату файлу. Записи лише розбираються
+        # в списки, колонки сховища заповнюються цілими масивами, кожен ключ стилю
+        # інтернується один раз, а об'єкти створюються як представлення без __init__
+        store = store if store is not None else default_store
+        classes, kinds, flat, style_ids, fills = [], [], [], [], []
+        vertices = {} # номер -> збережені вершини трикутника
+        texts = {}    # номер -> текст
+        cache = {}    # ключ стилю -> id
+        intern = styles.intern_key
+        for d in records:
+            cls = SHAPE_TYPES.get(d.get('type'))
+            if cls is None: continue
+            i = len(kinds)
+            kind = cls.kind
+            start, end = d['start'], d['end']
+            flat += (start['x'], start['y'], end['x'], end['y'])
+            family = size = None
+            if kind == TRIANGLE:
+                if 'point_a' in d:
+                    a, b, c = d['point_a'], d['point_b'], d['point_c']
+                    vertices[i] = (a['x'], a['y'], b['x'], b['y'], c['x'], c['y'])
+            elif kind == TEXT:
+                texts[i] = d.get('text', 'Текст')
+                family = d.get('font_family', cls.default_font[0])
+                size = d.get('font_size', cls.default_font[1])
+            fill = d['fill_color'] & 0xffffffff
+            key = (d['color'] & 0xffffffff, fill, d['line_width'], int(d.get('line_style', SOLID_LINE)), family, size)
+            style_id = cache.get(key)
+            if style_id is None:
+                style_id = cache[key] = intern(key).id
+            classes.append(cls)
+            kinds.append(kind)
+            style_ids.append(style_id)
+            fills.append(fill >> 24) # заливка увімкнена, якщо колір не прозорий
         
-        # Створюємо об'єкт потрібного класу
-        obj = None
-        if type_ == 'rectangle': obj = Rectangle(p1, p2)
-        elif type_ == 'ellipse': obj = Ellipse(p1, p2)
-        elif type_ == 'line':    obj = Line(p1, p2)
-        elif type_ == 'triangle':obj = Triangle(p1, p2)
-        elif type_ == 'arrow':   obj = Arrow(p1, p2)
-        elif type_ == 'text':
-            obj = TextShape(p1, p2)
-            obj.text = data.get('text', 'Текст')
-            obj.font_size = data.get('font_size', 20)
-            obj.font_family = data.get('font_family', 'Arial')
-            
-        if obj:
-            obj.color = QColor.fromRgba(data['color'])
-            obj.fill_color = QColor.fromRgba(data['fill_color'])
-            obj.line_width = data['line_width']
-            obj.line_style = data.get('line_style', Qt.SolidLine)
-            obj.fill_enabled = obj.fill_color.alpha() > 0
-            
-        return obj
+        n = len(kinds)
+        if not n: return []
+        kinds = np.array(kinds, np.int8)
+        coords = np.zeros((n, 10), np.int32)
+        coords[:, :4] = np.array(flat, np.int32).reshape(n, 4)
+        if vertices:
+            coords[list(vertices), AX:] = list(vertices.values())
+        # Вершини рахуємо лише для трикутників, у яких їх немає у файлі
+        missing = [i for i in np.flatnonzero(kinds == TRIANGLE).tolist() if i not in vertices]
+        if missing:
+            coords[missing, AX:] = Triangle.third_points(coords[missing])
+        
+        rows = store.allocate_many(kinds)
+        store.coords[rows] = coords
+        store.style[rows] = style_ids
+        store.flags[rows] = np.where(np.array(fills) > 0, ALIVE | FILL, ALIVE)
+        return [cls.view(store, row, texts[i]) if i in texts else cls.view(store, row)
+                for i, (cls, row) in enumerate(zip(classes, rows.tolist()))]
+
+# Номери рядків сховища для векторизованих операцій; attrgetter читає слот
+# без виклику властивості на кожну фігуру
+ROW = attrgetter('_row')
 
+def rows_of(shapes):
+    return np.fromiter(map(ROW, shapes), np.intp, len(shapes))
+
+@shape_type('rectangle')
 class Rectangle(Shape):
-    def draw(self, painter):
-        painter.setPen(QPen(self.color, self.line_width, self.line_style))
-        painter.setBrush(QBrush(self.fill_color) if self.fill_enabled else Qt.NoBrush)
+    __slots__ = ()
+    
+    def paint(self, painter):
+        painter.setPen(self.style.pen)
+        painter.setBrush(self.style.brush if self.fill_enabled else Qt.NoBrush)
         painter.drawRect(self.get_bounding_rect())
-        
-        if self.selected and not self.is_being_drawn:
-            self.draw_handles(painter)
-            
-    def draw_handles(self, painter):
-        painter.setPen(QPen(QColor(0, 120, 215), 1))
-        painter.setBrush(QBrush(Qt.white))
-        for r in self.get_resize_handles():
-            painter.drawRect(r)
+    
+    @classmethod
+    def paint_batch(cls, painter, shapes, rects):
+        first = shapes[0]
+        painter.setPen(first.style.pen)
+        painter.setBrush(first.style.brush if first.fill_enabled else Qt.NoBrush)
+        painter.drawRects(rects)
             
     def get_type(self): return 'rectangle'
 
+@shape_type('ellipse')
 class Ellipse(Shape):
-    def draw(self, painter):
-        painter.setPen(QPen(self.color, self.line_width, self.line_style))
-        painter.setBrush(QBrush(self.fill_color) if self.fill_enabled else Qt.NoBrush)
+    __slots__ = ()
+    
+    def paint(self, painter):
+        painter.setPen(self.style.pen)
+        painter.setBrush(self.style.brush if self.fill_enabled else Qt.NoBrush)
         painter.drawEllipse(self.get_bounding_rect())
-        
-        if self.selected and not self.is_being_drawn:
-            self.draw_handles(painter)
-            
-    def draw_handles(self, painter):
-        painter.setPen(QPen(QColor(0, 120, 215), 1))
-        painter.setBrush(QBrush(Qt.white))
-        for r in self.get_resize_handles():
-            painter.drawRect(r)
+    
+    @classmethod
+    def paint_batch(cls, painter, shapes, rects):
+        first = shapes[0]
+        painter.setPen(first.style.pen)
+        painter.setBrush(first.style.brush if first.fill_enabled else Qt.NoBrush)
+        for r in rects: painter.drawEllipse(r)
 
     def get_type(self): return 'ellipse'
 
+@shape_type('line')
 class Line(Shape):
-    def draw(self, painter):
-        painter.setPen(QPen(self.color, self.line_width, self.line_style))
+    __slots__ = ()
+    
+    def paint(self, painter):
+        painter.setPen(self.style.pen)
         painter.setBrush(Qt.NoBrush)
         painter.drawLine(self.start, self.end)
-        
-        if self.selected and not self.is_being_drawn:
-            self.draw_handles(painter)
+    
+    @classmethod
+    def paint_batch(cls, painter, shapes, rects):
+        painter.setPen(shapes[0].style.pen)
+        painter.setBrush(Qt.NoBrush)
+        painter.drawLines([QLine(s.start, s.end) for s in shapes])
             
-    def draw_handles(self, painter):
-        painter.setPen(QPen(QColor(0, 120, 215), 1))
-        painter.setBrush(QBrush(Qt.white))
+    def get_handle_rects(self):
         handles = self.get_resize_handles()
-        # Малюємо тільки кутові точки
-        for i in [0, 2, 5, 7]:
-            if i < len(handles): painter.drawRect(handles[i])
+        # Показуємо тільки кутові точки
+        return [handles[i] for i in [0, 2, 5, 7] if i < len(handles)]
 
     def get_type(self): return 'line'
 
+@shape_type('triangle')
 class Triangle(Shape):
-    def __init__(self, start, end):
-        super().__init__(start, end)
+    __slots__ = ()
+    
+    def __init__(self, start, end, store=None):
+        super().__init__(start, end, store)
         self.calculate_third_point()
+    
+    # Вершини трикутника
+    @property
+    def a(self):
+        x, y = self._store.coords[self._row, AX:AY + 1].tolist()
+        return QPoint(x, y)
+    @a.setter
+    def a(self, p): self._set_coords(AX, (p.x(), p.y()))
+    
+    @property
+    def b(self):
+        x, y = self._store.coords[self._row, BX:BY + 1].tolist()
+        return QPoint(x, y)
+    @b.setter
+    def b(self, p): self._set_coords(BX, (p.x(), p.y()))
+    
+    @property
+    def c(self):
+        x, y = self._store.coords[self._row, CX:CY + 1].tolist()
+        return QPoint(x, y)
+    @c.setter
+    def c(self, p): self._set_coords(CX, (p.x(), p.y()))
         
     def calculate_third_point(self):
         # Рахуємо координати трикутника (рівнобедрений)
-        x1, y1 = self.start.x(), self.start.y()
-        x2, y2 = self.end.x(), self.end.y()
+        x1, y1, x2, y2 = self._store.coords[self._row, X1:Y2 + 1].tolist()
         
         min_x, max_x = min(x1, x2), max(x1, x2)
         min_y, max_y = min(y1, y2), max(y1, y2)
         
         if y1 < y2:
-            self.a = QPoint(min_x, max_y)
-            self.b = QPoint(max_x, max_y)
-            self.c = QPoint(min_x + (max_x - min_x)//2, min_y)
+            pts = (min_x, max_y, max_x, max_y, min_x + (max_x - min_x)//2, min_y)
         else:
-            self.a = QPoint(min_x, min_y)
-            self.b = QPoint(max_x, min_y)
-            self.c = QPoint(min_x + (max_x - min_x)//2, max_y)
+            pts = (min_x, min_y, max_x, min_y, min_x + (max_x - min_x)//2, max_y)
+        self._set_coords(AX, pts)
+    
+    @staticmethod
+    def third_points(coords):
+        # Те саме для масиву рядків coords - вершини (AX..CY) кожного
+        x1, y1, x2, y2 = coords[:, X1], coords[:, Y1], coords[:, X2], coords[:, Y2]
+        min_x, max_x = np.minimum(x1, x2), np.maximum(x1, x2)
+        min_y, max_y = np.minimum(y1, y2), np.maximum(y1, y2)
+        base = np.where(y1 < y2, max_y, min_y)
+        apex = np.where(y1 < y2, min_y, max_y)
+        return np.stack([min_x, base, max_x, base, min_x + (max_x - min_x) // 2, apex], axis=1)
             
-    def draw(self, painter):
-        painter.setPen(QPen(self.color, self.line_width, self.line_style))
-        painter.setBrush(QBrush(self.fill_color) if self.fill_enabled else Qt.NoBrush)
-        painter.drawPolygon(QPolygon([self.a, self.b, self.c]))
-        
-        if self.selected and not self.is_being_drawn:
-            self.draw_handles(painter)
-
-    def draw_handles(self, painter):
-        painter.setPen(QPen(QColor(0, 120, 215), 1))
-        painter.setBrush(QBrush(Qt.white))
-        d = 8
-        for p in [self.a, self.b, self.c]:
-            painter.drawRect(p.x() - d//2, p.y() - d//2, d, d)
+    def build_geometry(self):
+        # Контур і рамка за трьома вершинами
+        ax, ay, bx, by, cx, cy = self._store.coords[self._row, AX:CY + 1].tolist()
+        outline = QPolygon([QPoint(ax, ay), QPoint(bx, by), QPoint(cx, cy)])
+        return outline, outline.boundingRect()
+    
+    def paint(self, painter):
+        painter.setPen(self.style.pen)
+        painter.setBrush(self.style.brush if self.fill_enabled else Qt.NoBrush)
+        painter.drawPolygon(self.geometry()[0])
+    
+    @classmethod
+    def paint_batch(cls, painter, shapes, rects):
+        first = shapes[0]
+        painter.setPen(first.style.pen)
+        painter.setBrush(first.style.brush if first.fill_enabled else Qt.NoBrush)
+        for s in shapes: painter.drawPolygon(s.geometry()[0])
 
     def get_type(self): return 'triangle'
     
     # Перевизначаємо для 3 точок
     def get_bounding_rect(self):
-        xs = [self.a.x(), self.b.x(), self.c.x()]
-        ys = [self.a.y(), self.b.y(), self.c.y()]
-        return QRect(QPoint(min(xs), min(ys)), QPoint(max(xs), max(ys)))
-        
-    def move(self, dx, dy):
-        super().move(dx, dy)
-        self.a.setX(self.a.x() + dx); self.a.setY(self.a.y() + dy)
-        self.b.setX(self.b.x() + dx); self.b.setY(self.b.y() + dy)
-        self.c.setX(self.c.x() + dx); self.c.setY(self.c.y() + dy)
+        return self.geometry()[1]
         
     def resize(self, idx, pt):
         if not self.selected: return
@@ -250,10 +471,9 @@ class Triangle(Shape):
         elif idx == 1: self.b = pt
         elif idx == 2: self.c = pt
         
-    def get_resize_handles(self):
-        if not self.selected: return []
-        d = 8
-        return [QRect(p.x() - d//2, p.y() - d//2, d, d) for p in [self.a, self.b, self.c]]
+    def build_resize_handles(self):
+        d = self.handle_size
+        return [QRectF(p.x() - d / 2, p.y() - d / 2, d, d) for p in [self.a, self.b, self.c]]
         
     def to_dict(self):
         d = super().to_dict()
@@ -263,86 +483,114 @@ class Triangle(Shape):
             'point_c': {'x': self.c.x(), 'y': self.c.y()}
         })
         return d
-        
-    @staticmethod
-    def from_dict(data):
-        t = Triangle(QPoint(data['start']['x'], data['start']['y']),
-                    QPoint(data['end']['x'], data['end']['y']))
-        if 'point_a' in data:
-            t.a = QPoint(data['point_a']['x'], data['point_a']['y'])
-            t.b = QPoint(data['point_b']['x'], data['point_b']['y'])
-            t.c = QPoint(data['point_c']['x'], data['point_c']['y'])
-        
-        t.color = QColor.fromRgba(data['color'])
-        t.fill_color = QColor.fromRgba(data['fill_color'])
-        t.line_width = data['line_width']
-        t.line_style = data.get('line_style', Qt.SolidLine)
-        t.fill_enabled = t.fill_color.alpha() > 0
-        return t
 
+@shape_type('arrow')
 class Arrow(Shape):
-    def draw(self, painter):
-        painter.setPen(QPen(self.color, self.line_width, self.line_style))
-        painter.setBrush(QBrush(self.fill_color) if self.fill_enabled else Qt.NoBrush)
-        painter.drawLine(self.start, self.end)
-        
-        # Малюємо стрілочку
-        dx = self.end.x() - self.start.x()
-        dy = self.end.y() - self.start.y()
-        angle = math.atan2(dy, dx)
+    __slots__ = ()
+    
+    def build_geometry(self):
+        # Лінія і наконечник-стрілочка
+        x1, y1, x2, y2 = self._store.coords[self._row, X1:Y2 + 1].tolist()
+        angle = math.atan2(y2 - y1, x2 - x1)
         size = 15
         
-        p1 = QPoint(int(self.end.x() - size * math.cos(angle - math.pi/6)),
-                   int(self.end.y() - size * math.sin(angle - math.pi/6)))
-        p2 = QPoint(int(self.end.x() - size * math.cos(angle + math.pi/6)),
-                   int(self.end.y() - size * math.sin(angle + math.pi/6)))
-                   
-        painter.setPen(QPen(self.color, self.line_width, Qt.SolidLine)) # Стрілка завжди суцільна
-        painter.setBrush(QBrush(self.fill_color) if self.fill_color.alpha() > 0 else QBrush(self.color))
-        painter.drawPolygon(QPolygon([self.end, p1, p2]))
+        p1 = QPoint(int(x2 - size * math.cos(angle - math.pi/6)),
+                   int(y2 - size * math.sin(angle - math.pi/6)))
+        p2 = QPoint(int(x2 - size * math.cos(angle + math.pi/6)),
+                   int(y2 - size * math.sin(angle + math.pi/6)))
+        return QLine(x1, y1, x2, y2), QPolygon([QPoint(x2, y2), p1, p2])
+    
+    def paint(self, painter):
+        line, head = self.geometry()
+        painter.setPen(self.style.pen)
+        painter.setBrush(self.style.brush if self.fill_enabled else Qt.NoBrush)
+        painter.drawLine(line)
         
-        if self.selected and not self.is_being_drawn:
-            self.draw_handles(painter)
-            
-    def draw_handles(self, painter):
-        painter.setPen(QPen(QColor(0, 120, 215), 1))
-        painter.setBrush(QBrush(Qt.white))
-        for r in self.get_resize_handles():
-            painter.drawRect(r)
+        painter.setPen(self.style.head_pen) # Стрілка завжди суцільна
+        painter.setBrush(self.style.head_brush)
+        painter.drawPolygon(head)
             
     def get_type(self): return 'arrow'
+    
+    def get_paint_rect(self):
+        # Наконечник може виходити за рамку лінії
+        m = self.line_width + 15
+        return self.get_bounding_rect().adjusted(-m, -m, m, m)
 
+@shape_type('text')
 class TextShape(Shape):
-    def __init__(self, start, end):
-        super().__init__(start, end)
+    __slots__ = ('text', 'is_editing', 'old_text', '_layout')
+    
+    default_font = ("Arial", 20)
+    
+    def __init__(self, start, end, store=None):
+        super().__init__(start, end, store)
         self.text = "Текст"
-        self.font_size = 20
-        self.font_family = "Arial"
+        self.style = styles.derive(self.style, font_family=self.default_font[0], font_size=self.default_font[1])
         self.fill_enabled = True
         self.is_editing = False
         self.old_text = ""
+        self._layout = None # (ключ, QStaticText)
+    
+    @classmethod
+    def view(cls, store, row, text="Текст"):
+        obj = super().view(store, row)
+        obj.text = text
+        obj.is_editing = False
+        obj.old_text = ""
+        obj._layout = None
+        return obj
         
-    def draw(self, painter):
-        if self.fill_color.alpha() > 0:
-            painter.setBrush(QBrush(self.fill_color))
+    def paint(self, painter, static=True):
+        # static=False - без кешованого макета (малювання не в потоці інтерфейсу)
+        style = self.style
+        rect = self.get_bounding_rect()
+        if style.fill_color.alpha() > 0:
+            painter.setBrush(style.brush)
             painter.setPen(Qt.NoPen)
-            painter.drawRect(self.get_bounding_rect())
-            
-        painter.setPen(QPen(self.color, 1))
-        painter.setFont(QFont(self.font_family, self.font_size))
-        painter.drawText(self.get_bounding_rect(), Qt.AlignCenter | Qt.TextWordWrap, self.text)
-        
-        if self.selected and not self.is_being_drawn:
-            self.draw_handles(painter)
+            painter.drawRect(rect)
             
-    def draw_handles(self, painter):
-        painter.setPen(QPen(QColor(0, 120, 215), 1))
-        painter.setBrush(QBrush(Qt.white))
-        for r in self.get_resize_handles():
-            painter.drawRect(r)
+        painter.setPen(style.text_pen)
+        painter.setFont(style.font)
+        if static:
+            # Як drawText з AlignCenter | TextWordWrap: по горизонталі вирівнює сам макет,
+            # по вертикалі центруємо за його висотою
+            layout = self.text_layout(rect.width())
+            size = layout.size()
+            if size.width() <= rect.width() and size.height() <= rect.height():
+                top = rect.top() + (rect.height() - size.height()) / 2
+                painter.drawStaticText(QPointF(rect.left(), top), layout)
+                return
+        # Текст не вміщується - drawText обріже його по рамці
+        painter.drawText(rect, Qt.AlignCenter | Qt.TextWordWrap, self.text)
+    
+    def text_layout(self, width):
+        # Розбивка на рядки рахується заново лише при зміні тексту, шрифту чи ширини
+        style = self.style
+        key = (self.text, style.font_family, style.font_size, width)
+        if self._layout is None or self._layout[0] != key:
+            static = QStaticText(self.text)
+            static.setTextFormat(Qt.PlainText)
+            static.setTextWidth(width)
+            option = QTextOption(Qt.AlignHCenter)
+            option.setWrapMode(QTextOption.WordWrap)
+            static.setTextOption(option)
+            static.prepare(font=style.font)
+            self._layout = (key, static)
+        return self._layout[1]
             
     def get_type(self): return 'text'
     
+    @property
+    def font_size(self): return self.style.font_size
+    @font_size.setter
+    def font_size(self, size): self.style = styles.derive(self.style, font_size=size)
+    
+    @property
+    def font_family(self): return self.style.font_family
+    @font_family.setter
+    def font_family(self, font): self.style = styles.derive(self.style, font_family=font)
+    
     def set_font_size(self, size):
         self.font_size = max(8, min(72, size))
         
@@ -364,4 +612,4 @@ class TextShape(Shape):
     def to_dict(self):
         d = super().to_dict()
         d.update({'text': self.text, 'font_size': self.font_size, 'font_family': self.font_family})
-        return d
\ No newline at end of file
+        return d
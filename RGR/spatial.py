@@ -0,0 +1,131 @@
+import numpy as np
+from store import TRIANGLE, AX, CY
+
+class GridIndex:
+    """Просторовий індекс фігур (рівномірна сітка комірок)"""
+
+    def __init__(self, cell_size=128):
+        self.cell_size = cell_size
+        self.cells = {}   # (cx, cy) -> set фігур
+        self.ranges = {}  # фігура -> (cx1, cy1, cx2, cy2)
+
+    def _range(self, rect):
+        c = self.cell_size
+        return (rect.left() // c, rect.top() // c, rect.right() // c, rect.bottom() // c)
+
+    def insert(self, shape):
+        # Область малювання покриває і contains() (рамка + 5 px)
+        self.insert_range(shape, self._range(shape.get_paint_rect()))
+
+    def insert_range(self, shape, r):
+        self.ranges[shape] = r
+        cells = self.cells
+        for cx in range(r[0], r[2] + 1):
+            for cy in range(r[1], r[3] + 1):
+                bucket = cells.get((cx, cy))
+                if bucket is None:
+                    bucket = cells[(cx, cy)] = set()
+                bucket.add(shape)
+
+    def remove(self, shape):
+        r = self.ranges.pop(shape, None)
+        if r is None: return
+        cells = self.cells
+        for cx in range(r[0], r[2] + 1):
+            for cy in range(r[1], r[3] + 1):
+                bucket = cells.get((cx, cy))
+                if bucket is None: continue
+                bucket.discard(shape)
+                if not bucket: del cells[(cx, cy)]
+
+    def update(self, shape):
+        # Переіндексуємо тільки якщо фігура перейшла в інші комірки
+        r = self._range(shape.get_paint_rect())
+        if self.ranges.get(shape) == r: return
+        self.remove(shape)
+        self.insert(shape)
+
+    def insert_many(self, shapes, bounds):
+        # bounds - масив рамок (left, top, right, bottom), порахований векторизовано
+        for s, r in zip(shapes, (bounds // self.cell_size).tolist()):
+            self.insert_range(s, tuple(r))
+
+    def update_many(self, shapes, bounds):
+        # Масове оновлення: переносимо лише фігури, що змінили комірки
+        ranges = self.ranges
+        for s, r in zip(shapes, (bounds // self.cell_size).tolist()):
+            r = tuple(r)
+            if ranges.get(s) == r: continue
+            self.remove(s)
+            self.insert_range(s, r)
+
+    def rebuild(self, shapes, bounds=None):
+        self.clear()
+        if bounds is None:
+            for s in shapes: self.insert(s)
+            return
+        self.insert_many(shapes, bounds)
+
+    def clear(self):
+        self.cells.clear()
+        self.ranges.clear()
+
+    def query_point(self, point):
+        c = self.cell_size
+        return self.cells.get((point.x() // c, point.y() // c), ())
+
+    def query_rect(self, rect):
+        rect = rect.normalized()
+        cx1, cy1, cx2, cy2 = self._range(rect)
+        cells = self.cells
+        found = set()
+        # Для великих прямокутників дешевше пройтись по заповнених комірках
+        if (cx2 - cx1 + 1) * (cy2 - cy1 + 1) > len(cells):
+            for (cx, cy), bucket in cells.items():
+                if cx1 <= cx <= cx2 and cy1 <= cy <= cy2:
+                    found.update(bucket)
+        else:
+            for cx in range(cx1, cx2 + 1):
+                for cy in range(cy1, cy2 + 1):
+                    bucket = cells.get((cx, cy))
+                    if bucket: found.update(bucket)
+        return found
+
+    def __len__(self):
+        return len(self.ranges)
+
+class HandleIndex:
+    """Ручки зміни розміру всіх виділених фігур у масивах NumPy.
+    Пошук ручки під курсором - одна векторизована перевірка замість 8 QRect на фігуру"""
+
+    def __init__(self, store, shapes, handle_size):
+        self.shapes = shapes # порядок перевірки - порядок виділення
+        rows = self.rows = np.fromiter((s.row for s in shapes), np.intp, len(shapes))
+        self.key = (int(store.version[rows].sum()), handle_size)
+        d = self.size = handle_size
+        h = d / 2
+        l, t, r, b = store.bounds(rows).astype(np.float64).T
+        # Центр як у QRect.center(): ділення з відкиданням дробової частини
+        cx = np.trunc((l + r) / 2)
+        cy = np.trunc((t + b) / 2)
+        # Ті ж 8 ручок, що й Shape.build_resize_handles: лівий верхній кут кожної
+        self.xs = np.stack([l, cx - h, r - d, l, r - d, l, cx - h, r - d], axis=1)
+        self.ys = np.stack([t, t, t, cy - h, cy - h, b - d, b - d, b - d], axis=1)
+        self.valid = np.ones(self.xs.shape, bool)
+        tri = store.kind[rows] == TRIANGLE
+        if tri.any():
+            # У трикутника 3 ручки - по центру вершин
+            v = store.coords[rows[tri], AX:CY + 1].astype(np.float64)
+            self.xs[tri, :3] = v[:, 0::2] - h
+            self.ys[tri, :3] = v[:, 1::2] - h
+            self.valid[tri, 3:] = False
+
+    def pick(self, point):
+        # (фігура, номер ручки) першої ручки під точкою (QPointF у світових координатах) або (None, -1)
+        px, py = point.x(), point.y()
+        xs, ys = self.xs, self.ys
+        hit = (xs <= px) & (px <= xs + self.size) & (ys <= py) & (py <= ys + self.size) & self.valid
+        found = np.flatnonzero(hit)
+        if not len(found): return None, -1
+        i = int(found[0])
+        return self.shapes[i // 8], i % 8
@@ -0,0 +1,196 @@
+import numpy as np
+
+# Коди типів фігур у сховищі
+KIND_CODES = {'rectangle': 1, 'ellipse': 2, 'line': 3, 'triangle': 4, 'arrow': 5, 'text': 6}
+ELLIPSE = KIND_CODES['ellipse']
+LINE = KIND_CODES['line']
+TRIANGLE = KIND_CODES['triangle']
+ARROW = KIND_CODES['arrow']
+
+# Прапорці рядка
+ALIVE = 1
+SELECTED = 2
+FILL = 4
+
+# Колонки coords: start, end і три вершини трикутника
+X1, Y1, X2, Y2, AX, AY, BX, BY, CX, CY = range(10)
+
+def segment_distance(px, py, x1, y1, x2, y2):
+    # Відстань від точки до відрізків (масиви кінців); вироджений відрізок - до точки
+    dx, dy = x2 - x1, y2 - y1
+    length2 = dx * dx + dy * dy
+    t = np.where(length2 > 0, ((px - x1) * dx + (py - y1) * dy) / np.where(length2 > 0, length2, 1), 0)
+    t = np.clip(t, 0, 1)
+    return np.hypot(px - (x1 + t * dx), py - (y1 + t * dy))
+
+class ShapeStore:
+    """Колонкове сховище фігур: типи, координати, стилі і прапорці в масивах NumPy.
+    Об'єкти Shape - лише легкі представлення (сховище + номер рядка)"""
+
+    def __init__(self, capacity=1024):
+        self.size = 0   # скільки рядків вже видано
+        self.free = []  # звільнені рядки для повторного використання
+        self.kind = np.zeros(capacity, np.int8)
+        self.coords = np.zeros((capacity, 10), np.int32)
+        self.style = np.zeros(capacity, np.int32)
+        self.flags = np.zeros(capacity, np.uint8)
+        self.version = np.zeros(capacity, np.uint32) # лічильник змін геометрії рядка
+
+    def _grow(self, needed):
+        capacity = len(self.kind)
+        if needed <= capacity: return
+        while capacity < needed: capacity *= 2
+        self.kind = np.resize(self.kind, capacity)
+        self.coords = np.resize(self.coords, (capacity, 10))
+        self.style = np.resize(self.style, capacity)
+        self.flags = np.resize(self.flags, capacity)
+        self.version = np.resize(self.version, capacity)
+
+    def allocate(self, kind):
+        if self.free:
+            row = self.free.pop()
+        else:
+            self._grow(self.size + 1)
+            row = self.size
+            self.size += 1
+        self.kind[row] = kind
+        self.coords[row] = 0
+        self.style[row] = 0
+        self.flags[row] = ALIVE
+        self.version[row] += 1
+        return row
+
+    def allocate_many(self, kinds):
+        # Рядки для масового завантаження: спершу звільнені (рядки замінених документів),
+        # решта - суцільним блоком у кінці. Так повторні відкриття не роздувають сховище
+        n = len(kinds)
+        reused = min(n, len(self.free))
+        taken = sorted(self.free[len(self.free) - reused:])
+        del self.free[len(self.free) - reused:]
+        fresh = n - reused
+        self._grow(self.size + fresh)
+        rows = np.concatenate([np.array(taken, np.intp), np.arange(self.size, self.size + fresh)])
+        self.size += fresh
+        self.kind[rows] = kinds
+        self.coords[rows] = 0
+        self.style[rows] = 0
+        self.flags[rows] = ALIVE
+        self.version[rows] += 1
+        return rows
+
+    def snapshot(self, rows):
+        # Незалежна копія рядків (вони стають 0..n-1) - напр. для фонового збереження
+        n = len(rows)
+        copy = ShapeStore(max(1, n))
+        copy.size = n
+        copy.kind[:n] = self.kind[rows]
+        copy.coords[:n] = self.coords[rows]
+        copy.style[:n] = self.style[rows]
+        copy.flags[:n] = self.flags[rows]
+        return copy
+
+    def release(self, row):
+        self.flags[row] = 0
+        self.free.append(row)
+
+    def used_styles(self):
+        # id стилів, на які посилаються живі рядки
+        live = (self.flags[:self.size] & ALIVE) > 0
+        return np.unique(self.style[:self.size][live])
+
+    # --- Векторизовані операції над наборами рядків ---
+    def bounds(self, rows):
+        # Нормалізовані рамки (left, top, right, bottom) як у QRect
+        c = self.coords[rows]
+        left = np.minimum(c[:, X1], c[:, X2])
+        top = np.minimum(c[:, Y1], c[:, Y2])
+        right = np.maximum(c[:, X1], c[:, X2])
+        bottom = np.maximum(c[:, Y1], c[:, Y2])
+        tri = self.kind[rows] == TRIANGLE
+        if tri.any():
+            t = c[tri]
+            left[tri] = t[:, [AX, BX, CX]].min(axis=1)
+            top[tri] = t[:, [AY, BY, CY]].min(axis=1)
+            right[tri] = t[:, [AX, BX, CX]].max(axis=1)
+            bottom[tri] = t[:, [AY, BY, CY]].max(axis=1)
+        return np.stack([left, top, right, bottom], axis=1)
+
+    def paint_bounds(self, rows, line_widths):
+        # Рамки з запасом на перо і наконечник стрілки (як Shape.get_paint_rect)
+        b = self.bounds(rows)
+        m = np.asarray(line_widths, np.int32)[self.style[rows]] + np.where(self.kind[rows] == ARROW, 15, 5)
+        b[:, :2] -= m[:, None]
+        b[:, 2:] += m[:, None]
+        return b
+
+    def intersects(self, rows, rect):
+        # Маска рядків, рамка яких перетинає QRect (як QRect.intersects)
+        if rect.isEmpty(): return np.zeros(len(rows), bool)
+        b = self.bounds(rows)
+        return ((b[:, 0] <= rect.right()) & (b[:, 2] >= rect.left()) &
+                (b[:, 1] <= rect.bottom()) & (b[:, 3] >= rect.top()))
+
+    def touch(self, rows):
+        # Геометрію змінено: кеші, прив'язані до версії рядка, застаріли
+        self.version[rows] += 1
+
+    def set_coords(self, rows, coords):
+        self.coords[rows] = coords
+        self.version[rows] += 1
+
+    def hit_test(self, rows, x, y, line_widths, tolerance=5):
+        # Маска рядків, фігура яких містить точку: спершу дешевий відсів за рамкою,
+        # потім точна перевірка лише кандидатів. Допуск - tolerance плюс половина пера
+        rows = np.asarray(rows, np.intp)
+        reach = tolerance + np.asarray(line_widths, np.float64)[self.style[rows]] / 2
+        b = self.bounds(rows)
+        hit = (b[:, 0] - reach <= x) & (x <= b[:, 2] + reach) & (b[:, 1] - reach <= y) & (y <= b[:, 3] + reach)
+        cand = np.flatnonzero(hit)
+        if not len(cand): return hit
+        rows, reach = rows[cand], reach[cand]
+        kind = self.kind[rows]
+        c = self.coords[rows].astype(np.float64)
+        exact = np.ones(len(rows), bool) # прямокутник і текст - вся рамка
+        
+        seg = (kind == LINE) | (kind == ARROW)
+        if seg.any():
+            s = c[seg]
+            exact[seg] = segment_distance(x, y, s[:, X1], s[:, Y1], s[:, X2], s[:, Y2]) <= reach[seg]
+        
+        ell = kind == ELLIPSE
+        if ell.any():
+            e = c[ell]
+            cx, cy = (e[:, X1] + e[:, X2]) / 2, (e[:, Y1] + e[:, Y2]) / 2
+            rx = np.abs(e[:, X2] - e[:, X1]) / 2 + reach[ell]
+            ry = np.abs(e[:, Y2] - e[:, Y1]) / 2 + reach[ell]
+            exact[ell] = ((x - cx) / rx) ** 2 + ((y - cy) / ry) ** 2 <= 1
+        
+        tri = kind == TRIANGLE
+        if tri.any():
+            t = c[tri]
+            ax, ay, bx, by, cx, cy = (t[:, i] for i in range(AX, CY + 1))
+            # Барицентрично: точка всередині, якщо знаки трьох векторних добутків однакові
+            d1 = (x - bx) * (ay - by) - (ax - bx) * (y - by)
+            d2 = (x - cx) * (by - cy) - (bx - cx) * (y - cy)
+            d3 = (x - ax) * (cy - ay) - (cx - ax) * (y - ay)
+            inside = ~(((d1 < 0) | (d2 < 0) | (d3 < 0)) & ((d1 > 0) | (d2 > 0) | (d3 > 0)))
+            edge = np.minimum(np.minimum(segment_distance(x, y, ax, ay, bx, by),
+                                         segment_distance(x, y, bx, by, cx, cy)),
+                              segment_distance(x, y, cx, cy, ax, ay))
+            exact[tri] = inside | (edge <= reach[tri])
+        
+        hit[cand] = exact
+        return hit
+
+    def move(self, rows, dx, dy):
+        # Зсув усіх точок (для не-трикутників вершини не використовуються)
+        self.coords[rows, 0::2] += dx
+        self.coords[rows, 1::2] += dy
+        self.version[rows] += 1
+
+    def set_flag(self, rows, flag, on):
+        if on: self.flags[rows] |= flag
+        else: self.flags[rows] &= ~np.uint8(flag)
+
+# Спільне сховище для фігур редактора
+default_store = ShapeStore()
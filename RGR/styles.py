@@ -0,0 +1,95 @@
+from PyQt5.QtCore import Qt
+from PyQt5.QtGui import QPen, QBrush, QColor, QFont
+
+class Style:
+    """Незмінний набір параметрів стилю з готовими QPen/QBrush/QFont.
+    Один об'єкт спільний для всіх фігур з однаковим стилем"""
+
+    __slots__ = ('id', 'key', 'color', 'fill_color', 'line_width', 'line_style',
+                 'font_family', 'font_size', 'pen', 'brush', 'text_pen',
+                 'head_pen', 'head_brush', '_font')
+
+    def __init__(self, id_, key):
+        rgba, fill_rgba, width, line_style, family, size = key
+        self.id = id_
+        self.key = key
+        self.color = QColor.fromRgba(rgba)
+        self.fill_color = QColor.fromRgba(fill_rgba)
+        self.line_width = width
+        self.line_style = Qt.PenStyle(line_style)
+        self.font_family = family
+        self.font_size = size
+
+        self.pen = QPen(self.color, width, self.line_style)
+        self.brush = QBrush(self.fill_color) if self.fill_color.alpha() > 0 else QBrush(Qt.NoBrush)
+        self.text_pen = QPen(self.color, 1)
+        # Наконечник стрілки завжди суцільний і залитий
+        self.head_pen = QPen(self.color, width, Qt.SolidLine)
+        self.head_brush = QBrush(self.fill_color) if self.fill_color.alpha() > 0 else QBrush(self.color)
+        self._font = None
+
+    @property
+    def font(self):
+        # QFont створюємо при першому малюванні (потрібен QGuiApplication)
+        if self._font is None and self.font_family is not None:
+            self._font = QFont(self.font_family, self.font_size)
+        return self._font
+
+class StyleTable:
+    """Таблиця інтернованих стилів: ключ параметрів -> Style.
+    Поки документ відкритий, стилі не витісняються: кожна нова комбінація кольору,
+    товщини чи шрифту лишається в таблиці (на неї може посилатись журнал скасування).
+    Після заміни документа reclaim() звільняє стилі, на які не посилається жодна фігура"""
+
+    def __init__(self):
+        self.by_key = {}
+        self.by_id = [] # id -> Style; None - звільнений id
+        self.free = []  # звільнені id для повторного використання
+
+    def intern(self, color, fill_color, line_width, line_style, font_family=None, font_size=None):
+        key = (color.rgba(), fill_color.rgba(), line_width, int(line_style), font_family, font_size)
+        return self.intern_key(key)
+
+    def intern_key(self, key):
+        style = self.by_key.get(key)
+        if style is None:
+            if self.free:
+                style = Style(self.free.pop(), key)
+                self.by_id[style.id] = style
+            else:
+                style = Style(len(self.by_id), key)
+                self.by_id.append(style)
+            self.by_key[key] = style
+        return style
+
+    def reclaim(self, used):
+        # Видаляє стилі, id яких немає в used (разом з їх QPen/QBrush/QFont); повертає їх кількість.
+        # Викликати, лише коли ніхто інший (фонові потоки, журнал скасування) не тримає старі id
+        used = set(used)
+        freed = [s for s in self.by_id if s is not None and s.id not in used]
+        for s in freed:
+            del self.by_key[s.key]
+            self.by_id[s.id] = None
+            self.free.append(s.id)
+        return len(freed)
+
+    def derive(self, style, **changes):
+        # Той самий стиль зі зміненими полями
+        rgba, fill_rgba, width, line_style, family, size = style.key
+        if 'color' in changes: rgba = changes['color'].rgba()
+        if 'fill_color' in changes: fill_rgba = changes['fill_color'].rgba()
+        if 'line_width' in changes: width = changes['line_width']
+        if 'line_style' in changes: line_style = int(changes['line_style'])
+        if 'font_family' in changes: family = changes['font_family']
+        if 'font_size' in changes: size = changes['font_size']
+        return self.intern_key((rgba, fill_rgba, width, line_style, family, size))
+
+    def line_widths(self):
+        # Товщина ліній за id стилю - для векторизованих розрахунків
+        return [s.line_width if s is not None else 0 for s in self.by_id]
+
+    def __len__(self):
+        return len(self.by_key)
+
+# Спільна таблиця стилів для всіх фігур
+styles = StyleTable()
@@ -0,0 +1,193 @@
+from PyQt5.QtCore import Qt, QObject, QRunnable, QThreadPool, QRect, QRectF, QLineF, QCoreApplication, pyqtSignal, pyqtSlot
+from PyQt5.QtGui import QPainter, QImage, QPen, QRegion
+from renderer import Renderer
+from files import Snapshot
+
+class TileJob(QRunnable):
+    """Растеризація однієї плитки у фоновому потоці.
+    Працює лише з QImage - QPixmap поза потоком інтерфейсу використовувати не можна.
+    Фігури беруться зі знімка: живі об'єкти з їх кешами (макет тексту, геометрія)
+    належать потоку інтерфейсу"""
+
+    def __init__(self, cache, tile, generation, key, view_rect, transform, snapshot, dpr, background, grid):
+        super().__init__()
+        self.cache = cache
+        self.tile, self.generation, self.key = tile, generation, key
+        self.view_rect = view_rect
+        self.transform = transform
+        self.snapshot = snapshot # копія фігур, вже відібраних і впорядкованих за z
+        self.dpr = dpr
+        self.background = background
+        self.grid = grid # (крок, колір, світова область сцени) або None
+
+    def run(self):
+        r = self.view_rect
+        image = QImage(round(r.width() * self.dpr), round(r.height() * self.dpr), QImage.Format_ARGB32_Premultiplied)
+        image.setDevicePixelRatio(self.dpr)
+        image.fill(self.background)
+        p = QPainter(image)
+        p.translate(-r.x(), -r.y())
+        p.setTransform(self.transform, True)
+        if self.grid:
+            self.draw_grid(p)
+        # Представлення знімка створюються тут і належать лише цьому потоку.
+        # Текст - через drawText: QStaticText готується під одне перетворення
+        Renderer(static_text=False).draw(p, self.snapshot.shapes())
+        p.end()
+        try:
+            self.cache.tileDone.emit(self.tile, self.generation, self.key, image)
+        except RuntimeError:
+            pass # полотно вже знищене (закриття програми)
+
+    def draw_grid(self, p):
+        # Ті ж лінії, що й плитка сітки полотна: по лівому і верхньому краю кожної клітинки
+        g, color, scene = self.grid
+        area = self.transform.inverted()[0].mapRect(QRectF(self.view_rect)).toAlignedRect() & scene
+        if area.isEmpty(): return
+        pen = QPen(color, 0)
+        p.setPen(pen)
+        x0 = area.left() - area.left() % g
+        y0 = area.top() - area.top() % g
+        top, bottom = area.top(), area.bottom() + 1
+        left, right = area.left(), area.right() + 1
+        p.drawLines([QLineF(x, top, x, bottom) for x in range(x0, right, g)] +
+                    [QLineF(left, y, right, y) for y in range(y0, bottom, g)])
+
+class TileCache(QObject):
+    """Статичний шар полотна (фон, сітка, невиділені фігури), нарізаний на плитки
+    фіксованого розміру у пікселях вигляду. Плитки растеризуються паралельно
+    на QThreadPool, а paintEvent лише копіює готові зображення.
+    Зміна позначає застарілими тільки зачеплені плитки; до появи нової версії
+    показується попередня. Після зміни масштабу чи зсуву сцени попередні плитки
+    показуються перенесеними і масштабованими, доки не готові нові"""
+
+    tileDone = pyqtSignal(object, int, object, QImage) # плитка, покоління, ключ вигляду, зображення
+
+    def __init__(self, canvas, size=256, max_tiles=256):
+        super().__init__(canvas)
+        self.canvas = canvas
+        self.size = size
+        self.max_tiles = max_tiles # 256 плиток 256x256 - близько 64 МБ
+        self.pool = QThreadPool(self)
+        self.images = {}     # (tx, ty) -> QImage (можливо застаріле); порядок - давність використання
+        self.generation = {} # (tx, ty) -> поточне покоління плитки
+        self.ready = {}      # (tx, ty) -> покоління, з якого зроблено зображення
+        self.pending = {}    # (tx, ty) -> покоління, що зараз растеризується
+        self.key = None      # параметри вигляду, з якими зроблено плитки
+        self.view = None     # (масштаб, x, y початку сцени) для ключа
+        self.stale = []      # [(QRectF у поточних пікселях вигляду, QImage)] плиток попереднього вигляду
+        self.stats = {'rendered': 0, 'discarded': 0}
+        self.tileDone.connect(self.on_tile_done)
+
+    def view_key(self):
+        # Зміна масштабу, початку сцени чи вигляду сітки робить недійсними всі плитки
+        c = self.canvas
+        return (c.zoom, c.scene_rect.x(), c.scene_rect.y(), c.devicePixelRatioF(), c.grid_enabled,
+                c.grid_size, c.grid_color.rgba(), c.background_color.rgba())
+
+    def clear(self):
+        # Вміст змінився цілком (інший документ) - старі зображення не показуємо
+        self.images.clear()
+        self.generation.clear()
+        self.ready.clear()
+        self.pending.clear()
+        self.stale = []
+        self.key = self.view = None
+
+    def rekey(self, key):
+        # Інший вигляд (масштаб, зсув сцени, сітка): готові плитки стають запасним шаром,
+        # перенесеним у нові координати, і показуються, доки не прийде заміна
+        c = self.canvas
+        view = (c.zoom, c.scene_rect.x(), c.scene_rect.y())
+        stale = []
+        if self.view is not None:
+            # старі пікселі вигляду -> світ -> нові пікселі вигляду
+            z0, x0, y0 = self.view
+            z1, x1, y1 = view
+            s, dx, dy = z1 / z0, (x0 - x1) * z1, (y0 - y1) * z1
+            def moved(r):
+                return QRectF(r.x() * s + dx, r.y() * s + dy, r.width() * s, r.height() * s)
+            stale = [(moved(r), image) for r, image in self.stale]
+            stale += [(moved(QRectF(self.tile_rect(t))), image) for t, image in self.images.items()]
+        self.clear()
+        self.stale = stale[-self.max_tiles:]
+        self.key, self.view = key, view
+
+    def tiles_in(self, rect):
+        s = self.size
+        for ty in range(rect.top() // s, rect.bottom() // s + 1):
+            for tx in range(rect.left() // s, rect.right() // s + 1):
+                yield (tx, ty)
+
+    def tile_rect(self, tile):
+        return QRect(tile[0] * self.size, tile[1] * self.size, self.size, self.size)
+
+    def invalidate(self, rect):
+        # rect - у пікселях вигляду
+        if self.key is None: return
+        gen = self.generation
+        for t in self.tiles_in(rect):
+            gen[t] = gen.get(t, 0) + 1
+
+    def paint(self, painter, rect):
+        key = self.view_key()
+        if key != self.key: self.rekey(key)
+        for t in self.tiles_in(rect):
+            gen = self.generation.get(t, 0)
+            if self.ready.get(t, -1) != gen and self.pending.get(t) != gen:
+                self.schedule(t, gen)
+            image = self.images.pop(t, None)
+            r = self.tile_rect(t)
+            if image is not None:
+                self.images[t] = image
+                painter.drawImage(r.topLeft(), image)
+            else:
+                painter.fillRect(r & rect, self.canvas.background_color)
+                if self.stale: self.paint_stale(painter, r & rect)
+
+    def paint_stale(self, painter, area):
+        # Замість ще не готової плитки - перенесені зображення попереднього вигляду
+        painter.save()
+        painter.setClipRect(area, Qt.IntersectClip)
+        target = QRectF(area)
+        for r, image in self.stale:
+            if r.intersects(target): painter.drawImage(r, image)
+        painter.restore()
+
+    def schedule(self, tile, gen):
+        c = self.canvas
+        r = self.tile_rect(tile)
+        shapes = [s for s in c.visible_shapes(QRegion(r)) if not s.selected]
+        grid = None
+        if c.grid_enabled and c.grid_size * c.zoom >= 4:
+            grid = (c.grid_size, c.grid_color, c.scene_rect)
+        snapshot = Snapshot(shapes)
+        for i in snapshot.texts: shapes[i].style.font # QFont стилю створюється лише в потоці інтерфейсу
+        self.pending[tile] = gen
+        self.pool.start(TileJob(self, tile, gen, self.key, r, c.view_transform(), snapshot,
+                                c.devicePixelRatioF(), c.background_color, grid))
+
+    @pyqtSlot(object, int, object, QImage)
+    def on_tile_done(self, tile, gen, key, image):
+        if key != self.key:
+            self.stats['discarded'] += 1
+            return
+        if self.pending.get(tile) == gen:
+            del self.pending[tile]
+        if gen < self.ready.get(tile, -1): return
+        self.images.pop(tile, None)
+        self.images[tile] = image
+        self.ready[tile] = gen
+        self.stats['rendered'] += 1
+        if not self.pending: self.stale = [] # усі замовлені плитки нового вигляду готові
+        # Найдавніше показані плитки витісняємо - при потребі їх буде перемальовано
+        while len(self.images) > self.max_tiles:
+            old = next(iter(self.images))
+            del self.images[old]
+            self.ready.pop(old, None)
+        self.canvas.update(self.tile_rect(tile))
+
+    def wait(self):
+        # Дочекатись усіх плиток (експорт, тести)
+        self.pool.waitForDone()
+        QCoreApplication.sendPostedEvents(self)
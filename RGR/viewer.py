@@ -1,14 +1,35 @@
+import math
+import time
+import numpy as np
 from PyQt5.QtWidgets import QWidget, QScrollArea, QInputDialog
-from PyQt5.QtCore import Qt, QPoint, QRect
-from PyQt5.QtGui import QPainter, QColor, QBrush, QPen, QCursor
-from shapes import Rectangle, Ellipse, Line, Triangle, Arrow, TextShape
+from PyQt5.QtCore import Qt, QPoint, QPointF, QRect, QEvent, pyqtSignal
+from PyQt5.QtGui import QPainter, QColor, QBrush, QPen, QCursor, QPixmap, QTransform
+from shapes import Shape, Rectangle, Ellipse, Line, Triangle, Arrow, TextShape, rows_of
+from spatial import GridIndex, HandleIndex
+from renderer import Renderer
+from store import default_store, SELECTED, FILL
+from styles import styles
+from scene import Scene, Selection
+from scheduler import FrameScheduler
+from tiles import TileCache
+from history import History, AddShapes, DeleteShapes, MoveShapes, ChangeGeometry, ChangeStyle, EditText
 
 class Canvas(QWidget):
     """Полотно для малювання"""
     
+    zoomRequested = pyqtSignal(float, QPoint) # множник, точка на полотні
+    panRequested = pyqtSignal(QPoint)         # зсув прокрутки
+    sceneChanged = pyqtSignal(QPoint)         # зсув початку сцени у пікселях вигляду
+    
     def __init__(self, parent=None):
         super().__init__(parent)
-        self.shapes = [] # Всі фігури тут
+        self.scene = Scene() # Всі фігури тут: сталі id і порядок z
+        self.store = default_store # Колонкові дані фігур
+        self.index = GridIndex() # Просторовий індекс для пошуку фігур
+        self.renderer = Renderer() # Малювання з рівнями деталізації
+        self.history = History() # Журнал скасування/повтору
+        self.gesture = 0 # лічильник жестів миші для злиття команд журналу
+        self.frames = FrameScheduler(self.process_move, self) # рух миші - раз на кадр
         self.current_shape = None
         
         # Статуси
@@ -16,23 +37,32 @@ class Canvas(QWidget):
         self.selecting = False
         self.resizing = False
         self.dragging = False
+        self.panning = False
         
         # Інструменти
         self.current_tool = 'select'
-        self.selected_shapes = [] 
+        self.selected_shapes = Selection(self.scene)
+        self._handle_index = None # ручки виділених фігур; скидається при зміні виділення
         self.selection_rect = QRect()
         
         # Для перетягування
         self.start_point = QPoint()
         self.drag_start = QPoint()
+        self.deferred_drag = True # зсув виділення застосовується до моделі лише при відпусканні
+        self.drag_offset = QPoint() # накопичений зсув поточного перетягування
+        self.drag_set = None # (фігури в порядку z, їх рамки на початку жесту)
         self.resize_handle = -1
         self.resize_shape = None
+        self.pan_last = QPoint()
         
         # Сітка (виправлено помилку з grid_enabled)
         self.grid_enabled = True
         self.grid_size = 20
         self.grid_color = QColor(220, 220, 220)
         self.background_color = QColor(240, 240, 240)
+        self._grid_cache = None # (ключ параметрів, QPixmap плитки)
+        self.tiles = TileCache(self) # статичний шар, що растеризується у фонових потоках
+        self.tiled = True # False - малювати все в потоці інтерфейсу
         
         # Редагування тексту
         self.editing_text = None
@@ -45,32 +75,119 @@ class Canvas(QWidget):
         self.font_size = 20
         self.font_family = "Arial"
         
-        # Розміри полотна
-        self.scene_w = 2000
-        self.scene_h = 2000
-        self.setMinimumSize(self.scene_w, self.scene_h)
+        # Сцена у світових координатах; росте під вміст
+        self.default_scene = QRect(0, 0, 2000, 2000)
+        self.scene_rect = QRect(self.default_scene)
+        self.scene_margin = 500
+        
+        # Масштаб вигляду
+        self.zoom = 1.0
+        self.min_zoom = 0.02
+        self.max_zoom = 32.0
+        
+        self.resize(self.view_size())
         self.setMouseTracking(True)
         self.setFocusPolicy(Qt.StrongFocus)
+        self.grabGesture(Qt.PinchGesture)
+
+    # --- Перетворення світ <-> вигляд ---
+    def view_transform(self):
+        t = QTransform()
+        t.scale(self.zoom, self.zoom)
+        t.translate(-self.scene_rect.x(), -self.scene_rect.y())
+        return t
+
+    def handle_margin(self):
+        # Запас на ручки у цілих світових одиницях (для QRect)
+        return math.ceil(Shape.handle_size)
+
+    def view_size(self):
+        size = self.scene_rect.size()
+        return size * self.zoom
+
+    def to_world(self, pos):
+        return QPoint(math.floor(pos.x() / self.zoom) + self.scene_rect.x(),
+                      math.floor(pos.y() / self.zoom) + self.scene_rect.y())
+
+    def to_world_f(self, pos):
+        return QPointF(pos.x() / self.zoom + self.scene_rect.x(),
+                       pos.y() / self.zoom + self.scene_rect.y())
+
+    def to_world_rect(self, rect):
+        return QRect(self.to_world(rect.topLeft()), self.to_world(rect.bottomRight())).adjusted(-1, -1, 1, 1)
+
+    def to_view_rect(self, rect):
+        return self.view_transform().mapRect(rect).adjusted(-2, -2, 2, 2)
+
+    def set_zoom(self, zoom):
+        zoom = max(self.min_zoom, min(self.max_zoom, zoom))
+        if zoom == self.zoom: return
+        self.zoom = zoom
+        # Ручки мають сталий розмір на екрані: 8 px, у світових одиницях - дробове число
+        Shape.handle_size = 8 / zoom
+        self.sceneChanged.emit(QPoint())
+        self.update()
+
+    def grow_scene(self, rect):
+        # Розширюємо сцену, якщо вміст вийшов за її межі
+        if self.scene_rect.contains(rect): return
+        m = self.scene_margin
+        old = self.scene_rect
+        self.scene_rect = old.united(rect.adjusted(-m, -m, m, m))
+        self.scene_resized(old)
+
+    def fit_scene(self):
+        # Після завантаження чи очищення сцена знову рівно охоплює вміст
+        old = self.scene_rect
+        rect = QRect(self.default_scene)
+        if self.scene:
+            b = self.store.paint_bounds(self.rows_of(self.scene), styles.line_widths())
+            rect |= QRect(QPoint(int(b[:, 0].min()), int(b[:, 1].min())),
+                          QPoint(int(b[:, 2].max()), int(b[:, 3].max())))
+        if rect != self.default_scene:
+            m = self.scene_margin
+            rect = rect.adjusted(-m, -m, m, m) | self.default_scene
+        self.scene_rect = rect
+        if rect != old: self.scene_resized(old)
+
+    def scene_resized(self, old):
+        shift = old.topLeft() - self.scene_rect.topLeft()
+        self.sceneChanged.emit(QPoint(round(shift.x() * self.zoom), round(shift.y() * self.zoom)))
+        self.update()
 
     def paintEvent(self, event):
+        started = time.perf_counter()
         painter = QPainter(self)
-        painter.fillRect(self.rect(), self.background_color)
+        region = event.region()
+        rect = event.rect()
+        painter.setClipRegion(region)
+        self.renderer.reset_stats()
         
-        # Малюємо сітку
-        if self.grid_enabled:
-            painter.setPen(self.grid_color)
-            for x in range(0, self.scene_w, self.grid_size):
-                painter.drawLine(x, 0, x, self.scene_h)
-            for y in range(0, self.scene_h, self.grid_size):
-                painter.drawLine(0, y, self.scene_w, y)
+        static = self.tiled
+        if static:
+            # Фон, сітка і невиділені фігури - з готових плиток
+            self.tiles.paint(painter, rect)
+        else:
+            self.draw_background(painter, rect)
         
-        # Малюємо фігури
-        for s in self.shapes:
-            if not s.selected: s.draw(painter)
+        # Далі малюємо у світових координатах
+        painter.setTransform(self.view_transform(), True)
+        if not static:
+            self.renderer.draw(painter, [s for s in self.visible_shapes(region) if not s.selected])
             
-        # Малюємо виділені поверх інших
-        for s in self.selected_shapes:
-            s.draw(painter)
+        # Малюємо виділені поверх інших, а їх ручки - поверх усього. Їх беремо з виділення,
+        # а не зі сцени: з плитками кадр не обходить решту фігур зовсім.
+        # Під час перетягування модель ще не зсунута - зсуваємо лише малювання
+        if self.drag_set is not None:
+            selected = self.dragged_shapes(region)
+            painter.translate(self.drag_offset)
+        else:
+            selected = self.selected_in(region)
+        if selected:
+            self.renderer.draw(painter, selected)
+            self.renderer.draw_handles(painter, selected)
+        if self.drag_set is not None:
+            painter.translate(-self.drag_offset)
             
         # Малюємо те, що зараз створюємо
         if self.current_shape:
@@ -78,23 +195,121 @@ class Canvas(QWidget):
             
         # Рамка виділення
         if self.selecting and not self.selection_rect.isNull():
-            painter.setPen(QPen(QColor(0, 120, 215), 1, Qt.DashLine))
+            pen = QPen(QColor(0, 120, 215), 1, Qt.DashLine)
+            pen.setCosmetic(True)
+            painter.setPen(pen)
             painter.setBrush(QBrush(QColor(0, 120, 215, 30)))
             painter.drawRect(self.selection_rect)
+        painter.end()
+        self.frames.note_paint((time.perf_counter() - started) * 1000)
+
+    def draw_background(self, painter, rect):
+        painter.fillRect(rect, self.background_color)
+        
+        # Сітка - це одна закешована плитка, розмножена по області.
+        # Надто дрібну сітку при віддаленні не малюємо
+        g = self.grid_size
+        if self.grid_enabled and g * self.zoom >= 4:
+            area = self.to_world_rect(rect) & self.scene_rect
+            if not area.isEmpty():
+                painter.save()
+                painter.setTransform(self.view_transform(), True)
+                painter.drawTiledPixmap(area, self.grid_tile(), QPoint(area.x() % g, area.y() % g))
+                painter.restore()
+
+    def visible_shapes(self, region):
+        # Тільки фігури, що перетинають область перемальовки, у порядку z.
+        # Після прокрутки область часто складається з кількох смуг -
+        # питаємо індекс по кожній, а не по їх спільній рамці
+        rects = region.rects()
+        if len(rects) == 1 or len(rects) > 8:
+            rects = [region.boundingRect()]
+        # Запас на ручки виділених фігур, що виступають за область малювання
+        h = self.handle_margin()
+        rects = [self.to_world_rect(r).adjusted(-h, -h, h, h) for r in rects]
+        found = set()
+        for r in rects: found |= self.index.query_rect(r)
+        if not found: return []
+        # Кандидатів з комірок індексу відсіюємо векторизовано за областями малювання
+        found = list(found)
+        b = self.store.paint_bounds(self.rows_of(found), styles.line_widths())
+        hit = np.zeros(len(found), bool)
+        for r in rects:
+            hit |= (b[:, 0] <= r.right()) & (b[:, 2] >= r.left()) & (b[:, 1] <= r.bottom()) & (b[:, 3] >= r.top())
+        return self.scene.sort([found[i] for i in np.flatnonzero(hit).tolist()])
+
+    def shapes_in(self, shapes, b, region, offset=QPoint()):
+        # Ті з фігур (b - їх рамки малювання), що після зсуву offset перетинають область перемальовки
+        h = self.handle_margin()
+        r = self.to_world_rect(region.boundingRect()).translated(-offset).adjusted(-h, -h, h, h)
+        hit = (b[:, 0] <= r.right()) & (b[:, 2] >= r.left()) & (b[:, 1] <= r.bottom()) & (b[:, 3] >= r.top())
+        return [shapes[i] for i in np.flatnonzero(hit).tolist()]
+
+    def selected_in(self, region):
+        shapes = self.selected_shapes.ordered()
+        if not shapes: return []
+        return self.shapes_in(shapes, self.store.paint_bounds(self.rows_of(shapes), styles.line_widths()), region)
+
+    def dragged_shapes(self, region):
+        # Виділені фігури, що після накопиченого зсуву перетинають область перемальовки
+        shapes, b = self.drag_set
+        return self.shapes_in(shapes, b, region, self.drag_offset)
+
+    def begin_drag(self):
+        self.drag_offset = QPoint()
+        if not self.deferred_drag: return
+        shapes = self.selected_shapes.ordered()
+        self.drag_set = (shapes, self.store.paint_bounds(self.rows_of(shapes), styles.line_widths()))
+
+    def end_drag(self):
+        # Один зсув моделі (і один запис журналу) на весь жест
+        if self.drag_set is None: return
+        shapes = self.drag_set[0]
+        dx, dy = self.drag_offset.x(), self.drag_offset.y()
+        self.drag_set = None
+        self.drag_offset = QPoint()
+        if not (dx or dy) or not shapes: return
+        rows = self.rows_of(shapes)
+        self.modify_shapes(shapes, lambda: self.store.move(rows, dx, dy))
+        self.history.push(MoveShapes(shapes, rows, dx, dy, self.gesture))
+
+    def cancel_gesture(self):
+        # Фігури прибрано зі сцени посеред перетягування чи зміни розміру (Delete, очищення,
+        # відкриття файлу) - жест скасовуємо, щоб відпускання не зсунуло й не записало їх
+        if self.drag_set is not None: self.invalidate_drag()
+        self.drag_set = None
+        self.drag_offset = QPoint()
+        self.dragging = self.resizing = False
+        self.resize_shape = None
+
+    def invalidate_drag(self):
+        b = self.drag_set[1]
+        if len(b):
+            self.invalidate_bounds(b + [self.drag_offset.x(), self.drag_offset.y()] * 2, False)
+
+    def visible_rect(self):
+        # Частина полотна, яку зараз видно у вікні прокрутки
+        viewport = self.parentWidget()
+        if viewport is None: return self.rect()
+        return QRect(self.mapFrom(viewport, QPoint(0, 0)), viewport.size()) & self.rect()
 
     def mousePressEvent(self, event):
+        self.frames.flush()
         if self.editing_text:
             self.finish_text_editing()
             return
 
-        pos = event.pos()
+        # Середня кнопка - панорамування
+        if event.button() == Qt.MiddleButton:
+            self.panning = True
+            self.pan_last = event.globalPos()
+            self.setCursor(Qt.ClosedHandCursor)
+            return
+
+        pos = self.to_world(event.pos())
         self.start_point = pos
         
-        clicked_shape = None
-        for s in reversed(self.shapes):
-            if s.contains(pos):
-                clicked_shape = s
-                break
+        clicked_shape = self.shape_at(pos)
         
         # Правий клік - редагування тексту
         if event.button() == Qt.RightButton:
@@ -105,13 +320,13 @@ class Canvas(QWidget):
         if event.button() == Qt.LeftButton:
             if self.current_tool == 'select':
                 # Перевіряємо ручки зміни розміру
-                for s in self.selected_shapes:
-                    idx = s.get_resize_handle_at(pos)
-                    if idx != -1:
-                        self.resizing = True
-                        self.resize_handle = idx
-                        self.resize_shape = s
-                        return # Виходимо, бо ми змінюємо розмір
+                s, idx = self.handle_at(self.to_world_f(event.pos()))
+                if s is not None:
+                    self.resizing = True
+                    self.gesture += 1
+                    self.resize_handle = idx
+                    self.resize_shape = s
+                    return # Виходимо, бо ми змінюємо розмір
 
                 # Логіка виділення
                 ctrl = event.modifiers() & Qt.ControlModifier
@@ -130,6 +345,8 @@ class Canvas(QWidget):
                             self.select(clicked_shape)
                     
                     self.dragging = True
+                    self.gesture += 1
+                    self.begin_drag()
                     self.drag_start = pos
                 else:
                     # Клікнули в порожнє місце - початок виділення рамкою
@@ -140,44 +357,190 @@ class Canvas(QWidget):
                 # Малювання нової фігури
                 self.drawing = True
                 self.create_shape(pos)
-        
-        self.update()
 
     def mouseMoveEvent(self, event):
-        pos = event.pos()
+        # Події накопичуються - модель оновлюється раз на кадр останньою з них
+        self.frames.post(event.pos(), event.globalPos())
+
+    def process_move(self, view_pos, global_pos):
+        if self.panning:
+            delta = global_pos - self.pan_last
+            self.pan_last = global_pos
+            self.panRequested.emit(-delta)
+            return
+
+        pos = self.to_world(view_pos)
         
         # Зміна курсора
-        if self.current_tool == 'select' and not self.drawing:
-            self.update_cursor(pos)
+        if self.current_tool == 'select' and not self.drawing and not self.dragging:
+            self.update_cursor(self.to_world_f(view_pos))
             
         if self.resizing and self.resize_shape:
-            self.resize_shape.resize(self.resize_handle, pos)
-            self.update()
+            s = self.resize_shape
+            rows = self.rows_of([s])
+            old = self.store.coords[rows]
+            self.modify_shapes([s], lambda: s.resize(self.resize_handle, pos))
+            new = self.store.coords[rows]
+            if not np.array_equal(old, new):
+                self.history.push(ChangeGeometry([s], rows, old, new, self.gesture))
         elif self.dragging and self.selected_shapes:
             dx = pos.x() - self.drag_start.x()
             dy = pos.y() - self.drag_start.y()
-            for s in self.selected_shapes:
-                s.move(dx, dy)
+            if self.drag_set is not None:
+                # Лише накопичуємо зсув і перемальовуємо старе й нове місце виділення
+                self.invalidate_drag()
+                self.drag_offset += QPoint(dx, dy)
+                self.invalidate_drag()
+            elif dx or dy:
+                selected = list(self.selected_shapes)
+                rows = self.rows_of(selected)
+                # Один векторизований зсув для всього виділення
+                self.modify_shapes(selected, lambda: self.store.move(rows, dx, dy))
+                # Кроки одного перетягування зливаються в один запис журналу
+                self.history.push(MoveShapes(selected, rows, dx, dy, self.gesture))
             self.drag_start = pos
-            self.update()
         elif self.selecting:
+            self.invalidate_selection_rect()
             self.selection_rect = QRect(self.start_point, pos).normalized()
-            self.update()
+            self.invalidate_selection_rect()
         elif self.drawing and self.current_shape:
+            self.invalidate(self.current_shape)
             self.current_shape.end = pos
             # Оновлюємо трикутник
             if isinstance(self.current_shape, Triangle):
                 self.current_shape.calculate_third_point()
-            self.update()
+            self.invalidate(self.current_shape)
+
+    def wheelEvent(self, event):
+        # Ctrl + коліщатко - масштаб, інакше звичайна прокрутка
+        if event.modifiers() & Qt.ControlModifier:
+            self.zoomRequested.emit(1.25 ** (event.angleDelta().y() / 120), event.pos())
+            event.accept()
+        else:
+            event.ignore()
+
+    def event(self, event):
+        # Щипок на тачпаді (macOS) або сенсорному екрані
+        if event.type() == QEvent.NativeGesture and event.gestureType() == Qt.ZoomNativeGesture:
+            self.zoomRequested.emit(1 + event.value(), event.pos())
+            return True
+        if event.type() == QEvent.Gesture:
+            pinch = event.gesture(Qt.PinchGesture)
+            if pinch:
+                center = self.mapFromGlobal(pinch.centerPoint().toPoint())
+                self.zoomRequested.emit(pinch.scaleFactor(), center)
+                return True
+        return super().event(event)
+
+    def grid_tile(self):
+        # Плитка перебудовується тільки коли змінились параметри сітки чи масштаб.
+        # Логічний розмір плитки - один крок сітки у світових координатах
+        dpr = self.devicePixelRatioF()
+        key = (self.grid_size, self.grid_color.rgba(), self.background_color.rgba(), dpr, self.zoom)
+        if self._grid_cache is None or self._grid_cache[0] != key:
+            g = self.grid_size
+            px = max(1, round(g * self.zoom * dpr))
+            tile = QPixmap(px, px)
+            tile.setDevicePixelRatio(px / g)
+            tile.fill(self.background_color)
+            p = QPainter(tile)
+            p.setPen(QPen(self.grid_color, 0))
+            p.drawLine(0, 0, g, 0)
+            p.drawLine(0, 0, 0, g)
+            p.end()
+            self._grid_cache = (key, tile)
+        return self._grid_cache[1]
+
+    def invalidate(self, shape):
+        # Позначаємо для перемальовки тільки область фігури (з ручками, якщо виділена)
+        rect = shape.get_paint_rect()
+        if shape.selected:
+            h = self.handle_margin()
+            rect = rect.adjusted(-h, -h, h, h)
+        rect = self.to_view_rect(rect)
+        # Фігура, яку ще малюють, не входить у плитки
+        if shape in self.scene: self.tiles.invalidate(rect)
+        self.update(rect)
+
+    def shape_changed(self, shape):
+        # Геометрія змінилась: оновлюємо індекс і нову область
+        self.index.update(shape)
+        self.grow_scene(shape.get_paint_rect())
+        self.invalidate(shape)
+
+    def invalidate_bounds(self, bounds, static=True):
+        # Для невеликої кількості фігур - окремі області, для масових змін - одна спільна рамка.
+        # static=False - змінились лише виділені фігури, плитки статичного шару не зачеплені
+        if len(bounds) > 32:
+            bounds = [[bounds[:, 0].min(), bounds[:, 1].min(), bounds[:, 2].max(), bounds[:, 3].max()]]
+        h = self.handle_margin()
+        for l, t, r, b in np.asarray(bounds).tolist():
+            rect = self.to_view_rect(QRect(QPoint(l, t), QPoint(r, b)).adjusted(-h, -h, h, h))
+            if static: self.tiles.invalidate(rect)
+            self.update(rect)
+
+    def modify_shapes(self, shapes, func):
+        # Зміна геометрії чи стилю групи фігур: func змінює дані,
+        # а індекс, межі сцени і перемальовку оновлюємо векторизовано
+        if not shapes: return
+        rows = self.rows_of(shapes)
+        static = not (self.store.flags[rows] & SELECTED).all()
+        self.invalidate_bounds(self.store.paint_bounds(rows, styles.line_widths()), static)
+        func()
+        b = self.store.paint_bounds(rows, styles.line_widths())
+        self.index.update_many(shapes, b)
+        self.grow_scene(QRect(QPoint(int(b[:, 0].min()), int(b[:, 1].min())),
+                              QPoint(int(b[:, 2].max()), int(b[:, 3].max()))))
+        self.invalidate_bounds(b, static)
+
+    def insert_shapes(self, shapes, ids, zs):
+        # Повернення фігур на сцену з їх попередніми id і z
+        self.scene.add_many(shapes, ids, zs)
+        rows = self.rows_of(shapes)
+        b = self.store.paint_bounds(rows, styles.line_widths())
+        self.index.insert_many(shapes, b)
+        self.grow_scene(QRect(QPoint(int(b[:, 0].min()), int(b[:, 1].min())),
+                              QPoint(int(b[:, 2].max()), int(b[:, 3].max()))))
+        self.invalidate_bounds(b)
+
+    def remove_shapes(self, shapes):
+        self.cancel_gesture()
+        rows = self.rows_of(shapes)
+        self.invalidate_bounds(self.store.paint_bounds(rows, styles.line_widths()))
+        self.store.set_flag(rows, SELECTED, False)
+        for s in shapes: self.selected_shapes.discard(s)
+        self._handle_index = None
+        for s in self.scene.remove_many(shapes):
+            self.index.remove(s)
+
+    def undo(self):
+        if self.drawing or self.dragging or self.resizing: return False
+        return self.history.undo(self)
+
+    def redo(self):
+        if self.drawing or self.dragging or self.resizing: return False
+        return self.history.redo(self)
+
+    def invalidate_selection_rect(self):
+        if not self.selection_rect.isNull():
+            self.update(self.to_view_rect(self.selection_rect))
 
     def mouseReleaseEvent(self, event):
+        self.frames.flush()
+        if event.button() == Qt.MiddleButton and self.panning:
+            self.panning = False
+            self.setCursor(Qt.ArrowCursor)
+            return
         if event.button() == Qt.LeftButton:
             if self.selecting:
                 # Виділяємо все, що потрапило в рамку
-                for s in self.shapes:
-                    if s.is_in_selection_rect(self.selection_rect):
-                        self.select(s)
+                found = self.scene.sort(list(self.index.query_rect(self.selection_rect)))
+                if found:
+                    hits = self.store.intersects(self.rows_of(found), self.selection_rect)
+                    for s, hit in zip(found, hits.tolist()):
+                        if hit: self.select(s)
                 self.selecting = False
+                self.invalidate_selection_rect()
                 self.selection_rect = QRect()
             
             elif self.drawing and self.current_shape:
@@ -190,20 +553,48 @@ class Canvas(QWidget):
                 else:
                     self.add_shape(self.current_shape)
                 
+                self.invalidate(self.current_shape)
                 self.current_shape = None
                 self.drawing = False
             
+            self.end_drag()
             self.dragging = False
             self.resizing = False
             self.resize_shape = None
-            self.update()
 
     def mouseDoubleClickEvent(self, event):
         if event.button() == Qt.LeftButton and self.current_tool == 'select':
-             for s in reversed(self.shapes):
-                if isinstance(s, TextShape) and s.contains(event.pos()):
-                    self.start_text_editing(s)
-                    break
+            s = self.shape_at(self.to_world(event.pos()), TextShape)
+            if s: self.start_text_editing(s)
+
+    def rows_of(self, shapes):
+        return rows_of(shapes)
+
+    def handle_at(self, pos):
+        # Ручка під курсором (pos - QPointF у світових координатах) серед усіх виділених фігур:
+        # (фігура, номер) або (None, -1).
+        # Індекс перебудовується після зміни виділення, геометрії чи розміру ручок
+        if not self.selected_shapes: return None, -1
+        index = self._handle_index
+        if (index is None or index.size != Shape.handle_size or
+                index.key[0] != int(self.store.version[index.rows].sum())):
+            index = self._handle_index = HandleIndex(self.store, list(self.selected_shapes), Shape.handle_size)
+        return index.pick(pos)
+
+    def shape_at(self, pos, kind=None):
+        # Верхня фігура під точкою: кандидати з комірки індексу перевіряються
+        # точно і векторизовано, перевага більшому z
+        candidates = list(self.index.query_point(pos))
+        if kind is not None: candidates = [s for s in candidates if isinstance(s, kind)]
+        if not candidates: return None
+        hits = self.store.hit_test(self.rows_of(candidates), pos.x(), pos.y(), styles.line_widths())
+        z_of = self.scene.z_of
+        top, top_z = None, float('-inf')
+        for i in np.flatnonzero(hits).tolist():
+            s = candidates[i]
+            z = z_of(s)
+            if z > top_z: top, top_z = s, z
+        return top
 
     def create_shape(self, pos):
         tool = self.current_tool
@@ -226,27 +617,38 @@ class Canvas(QWidget):
             
         s.is_being_drawn = True
         self.current_shape = s
+        self.invalidate(s)
 
     def add_shape(self, shape):
         shape.is_being_drawn = False
-        self.shapes.append(shape)
+        id_ = self.scene.add(shape)
+        self.history.push(AddShapes([shape], [id_], [self.scene.z_of(shape)]))
+        self.index.insert(shape)
+        self.grow_scene(shape.get_paint_rect())
+        self.invalidate(shape)
         self.clear_selection()
         self.select(shape)
 
     def select(self, shape):
         if shape not in self.selected_shapes:
             shape.selected = True
-            self.selected_shapes.append(shape)
+            self.selected_shapes.add(shape)
+            self._handle_index = None
+            self.invalidate(shape)
 
     def deselect(self, shape):
         if shape in self.selected_shapes:
             shape.selected = False
-            self.selected_shapes.remove(shape)
+            self.selected_shapes.discard(shape)
+            self._handle_index = None
+            self.invalidate(shape)
 
     def clear_selection(self):
         for s in self.selected_shapes:
             s.selected = False
+            self.invalidate(s)
         self.selected_shapes.clear()
+        self._handle_index = None
 
     def start_text_editing(self, shape):
         if self.editing_text: self.finish_text_editing()
@@ -257,11 +659,14 @@ class Canvas(QWidget):
         shape.start_editing()
         
         text, ok = QInputDialog.getText(self, "Редагування", "Текст:", text=shape.text)
+        old = shape.old_text
         if ok: shape.finish_editing(text)
         else: shape.cancel_editing()
         
         self.editing_text = None
-        self.update()
+        self.invalidate(shape)
+        if shape.text != old:
+            self.history.push(EditText(shape, old, shape.text))
 
     def finish_text_editing(self):
         if self.editing_text:
@@ -271,15 +676,13 @@ class Canvas(QWidget):
     def update_cursor(self, pos):
         # Курсор для зміни розміру
         cursor = Qt.ArrowCursor
-        for s in self.selected_shapes:
-            idx = s.get_resize_handle_at(pos)
-            if idx != -1:
-                if isinstance(s, Triangle): cursor = Qt.SizeAllCursor
-                elif idx in [0, 7]: cursor = Qt.SizeFDiagCursor
-                elif idx in [1, 6]: cursor = Qt.SizeVerCursor
-                elif idx in [2, 5]: cursor = Qt.SizeBDiagCursor
-                elif idx in [3, 4]: cursor = Qt.SizeHorCursor
-                break
+        s, idx = self.handle_at(pos)
+        if s is not None:
+            if isinstance(s, Triangle): cursor = Qt.SizeAllCursor
+            elif idx in [0, 7]: cursor = Qt.SizeFDiagCursor
+            elif idx in [1, 6]: cursor = Qt.SizeVerCursor
+            elif idx in [2, 5]: cursor = Qt.SizeBDiagCursor
+            elif idx in [3, 4]: cursor = Qt.SizeHorCursor
         self.setCursor(cursor)
     
     def set_tool(self, t): 
@@ -305,32 +708,104 @@ class Canvas(QWidget):
         self._update_selected_props(lambda sh: sh.set_font_family(f) if isinstance(sh, TextShape) else None)
         
     def _update_selected_props(self, func):
-        if self.current_shape: func(self.current_shape)
-        for s in self.selected_shapes: func(s)
-        self.update()
+        # Товщина лінії змінює область малювання, тому оновлюємо до і після
+        if self.current_shape:
+            self.invalidate(self.current_shape)
+            func(self.current_shape)
+            self.invalidate(self.current_shape)
+        shapes = list(self.selected_shapes)
+        if not shapes: return
+        rows = self.rows_of(shapes)
+        store = self.store
+        old_styles, old_fill = store.style[rows], store.flags[rows] & FILL
+        def apply():
+            for s in shapes: func(s)
+        self.modify_shapes(shapes, apply)
+        new_styles, new_fill = store.style[rows], store.flags[rows] & FILL
+        if not (np.array_equal(old_styles, new_styles) and np.array_equal(old_fill, new_fill)):
+            self.history.push(ChangeStyle(shapes, rows, old_styles, old_fill, new_styles, new_fill))
         
+    def scene_record(self, shapes):
+        # Фігури з їх id і z - для команд додавання/видалення
+        return shapes, [self.scene.id_of(s) for s in shapes], [self.scene.z_of(s) for s in shapes]
+
     def clear_scene(self):
-        self.shapes.clear()
+        if self.scene:
+            self.history.push(DeleteShapes(*self.scene_record(list(self.scene))))
+        self.cancel_gesture()
         self.clear_selection()
-        self.update()
+        self.scene.clear()
+        self.index.clear()
+        self.fit_scene()
+        self.tiles.clear()
+        self.update(self.visible_rect())
         
     def delete_selected(self):
-        for s in self.selected_shapes:
-            if s in self.shapes: self.shapes.remove(s)
-        self.clear_selection()
-        self.update()
+        # Видалення з O(1) на фігуру замість пошуку в списку
+        shapes = self.selected_shapes.ordered()
+        if not shapes: return
+        self.history.push(DeleteShapes(*self.scene_record(shapes)))
+        self.remove_shapes(shapes)
         
-    def get_shapes(self): return self.shapes
+    def get_shapes(self): return list(self.scene)
     def set_shapes(self, s): 
-        self.shapes = s
-        self.update()
+        self.history.clear()
+        self.cancel_gesture()
+        self.clear_selection()
+        self.scene.clear()
+        self.scene.extend(s)
+        if s:
+            self.index.rebuild(s, self.store.paint_bounds(self.rows_of(s), styles.line_widths()))
+        else:
+            self.index.clear()
+        self.fit_scene()
+        self.tiles.clear()
+        self.update(self.visible_rect())
 
 class Viewer(QScrollArea):
     def __init__(self, parent=None):
         super().__init__(parent)
         self.canvas = Canvas(self)
         self.setWidget(self.canvas)
-        self.setWidgetResizable(True)
+        # Розміром полотна керуємо самі: він залежить від сцени і масштабу
+        self.setWidgetResizable(False)
+        self.canvas.sceneChanged.connect(self.on_scene_changed)
+        self.canvas.zoomRequested.connect(self.zoom_at)
+        self.canvas.panRequested.connect(self.pan_by)
     
     def get_canvas(self): 
-        return self.canvas
\ No newline at end of file
+        return self.canvas
+
+    def fit_canvas(self):
+        self.canvas.resize(self.canvas.view_size().expandedTo(self.viewport().size()))
+
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        self.fit_canvas()
+
+    def on_scene_changed(self, shift):
+        # Якщо сцена виросла вліво/вгору - прокручуємо, щоб вміст не зсувався на екрані
+        self.fit_canvas()
+        self.pan_by(shift)
+
+    def pan_by(self, delta):
+        h, v = self.horizontalScrollBar(), self.verticalScrollBar()
+        h.setValue(h.value() + delta.x())
+        v.setValue(v.value() + delta.y())
+
+    def zoom_at(self, factor, pos):
+        # Точка світу під курсором залишається на місці
+        c = self.canvas
+        world = c.to_world_f(pos)
+        anchor = pos + c.pos()
+        c.set_zoom(c.zoom * factor)
+        view = c.view_transform().map(world)
+        self.horizontalScrollBar().setValue(round(view.x() - anchor.x()))
+        self.verticalScrollBar().setValue(round(view.y() - anchor.y()))
+
+    def zoom_in(self): self.zoom_at(1.25, self.viewport_center())
+    def zoom_out(self): self.zoom_at(0.8, self.viewport_center())
+    def reset_zoom(self): self.zoom_at(1 / self.canvas.zoom, self.viewport_center())
+
+    def viewport_center(self):
+        return self.viewport().rect().center() - self.canvas.pos()